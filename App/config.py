@@ -1,4 +1,96 @@
 import os
+from urllib.parse import quote_plus
+
+# Login throttling (see App.controllers.throttle). Override in custom_config.py,
+# as FLASK_-prefixed environment variables or through create_app() overrides.
+LOGIN_THROTTLE_DEFAULTS = {
+    'LOGIN_THROTTLE_ENABLED': True,
+    # SQLite file shared by every worker on the node; empty uses one in the temp directory
+    'LOGIN_THROTTLE_STORE': '',
+    # Attempts allowed back to back, and sustained attempts per minute, per username
+    'LOGIN_THROTTLE_USER_BURST': 5,
+    'LOGIN_THROTTLE_USER_PER_MINUTE': 5,
+    # The same per client IP, looser so shared NATs can still sign in
+    'LOGIN_THROTTLE_IP_BURST': 20,
+    'LOGIN_THROTTLE_IP_PER_MINUTE': 30,
+}
+
+# Database engine. The URI comes from DATABASE_URL, or the POSTGRES_* variables
+# render.yaml injects, and falls back to App/data.db; other knobs as above.
+DATABASE_DEFAULTS = {
+    # Connection pool per worker process; Postgres only, SQLite connections are cheap to open
+    'DATABASE_POOL_SIZE': 5,
+    'DATABASE_MAX_OVERFLOW': 10,
+    'DATABASE_POOL_TIMEOUT': 30,
+    # Seconds before a pooled connection is replaced, staying under server and proxy idle timeouts
+    'DATABASE_POOL_RECYCLE': 1800,
+    'DATABASE_POOL_PRE_PING': True,
+    # PRAGMAs run on every new SQLite connection; an empty value leaves SQLite's default
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    # Negative sizes are in KiB, as PRAGMA cache_size takes them
+    'SQLITE_CACHE_SIZE': -64000,
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    # Comma-separated read replicas; GET requests and read-only controllers query one of them
+    'DATABASE_REPLICA_URLS': '',
+    # Seconds after a client's write during which its reads stay on the primary
+    'DATABASE_READ_YOUR_WRITES_SECONDS': 5,
+}
+
+def _load_defaults(app, defaults):
+    for key, value in defaults.items():
+        app.config.setdefault(key, value)
+        env_value = os.getenv(f'FLASK_{key}')
+        if env_value is not None:
+            app.config[key] = env_value.lower() in ('1', 'true', 'yes') if isinstance(value, bool) else type(value)(env_value)
+
+def load_login_throttle_config(app):
+    _load_defaults(app, LOGIN_THROTTLE_DEFAULTS)
+
+def database_uri(default):
+    url = os.getenv('DATABASE_URL')
+    if not url and os.getenv('POSTGRES_URL'):
+        url = 'postgresql://{}:{}@{}/{}'.format(
+            quote_plus(os.getenv('POSTGRES_USER', '')), quote_plus(os.getenv('POSTGRES_PASSWORD', '')),
+            os.getenv('POSTGRES_URL'), os.getenv('POSTGRES_DB', '')
+        )
+    if not url:
+        return default
+    return _normalize_url(url)
+
+def _normalize_url(url):
+    # Hosting providers hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def load_database_config(app):
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_uri('sqlite:///' + os.path.join(app.root_path, 'data.db')))
+    _load_defaults(app, DATABASE_DEFAULTS)
+
+def database_engine_options(config, url=None):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database, or url; SQLite is tuned per connection instead."""
+    if (url or config['SQLALCHEMY_DATABASE_URI']).startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+    }
+
+def replica_urls(config):
+    """DATABASE_REPLICA_URLS, given as a list or a comma-separated string, as a list of URLs."""
+    urls = config.get('DATABASE_REPLICA_URLS') or []
+    if isinstance(urls, str):
+        urls = urls.split(',')
+    return [_normalize_url(url.strip()) for url in urls if url.strip()]
+
+def replica_engine_options(config):
+    """Keyword arguments for create_engine() of each read replica, url included."""
+    return [dict(database_engine_options(config, url), url=url) for url in replica_urls(config)]
 
 def load_config(app, overrides):
     if os.path.exists(os.path.join('./App', 'custom_config.py')):
@@ -6,6 +98,8 @@ def load_config(app, overrides):
     else:
         app.config.from_object('App.default_config')
     app.config.from_prefixed_env()
+    load_login_throttle_config(app)
+    load_database_config(app)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['TEMPLATES_AUTO_RELOAD'] = True
     app.config['PREFERRED_URL_SCHEME'] = 'https'
@@ -16,4 +110,5 @@ def load_config(app, overrides):
     app.config["JWT_COOKIE_CSRF_PROTECT"] = False
     app.config['FLASK_ADMIN_SWATCH'] = 'darkly'
     for key in overrides:
-        app.config[key] = overrides[key]
\ No newline at end of file
+        app.config[key] = overrides[key]
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database_engine_options(app.config))
@@ -1,3 +1,5 @@
+# Apartment.amenity_mask stores one bit per entry, indexed by position in this
+# list, so new amenities must only ever be appended to the end.
 AMENITIES = [
     "Air Conditioning",
     "Swimming Pool",
@@ -32,6 +34,14 @@ AMENITIES = [
     "Parking"
 ]
 
+AMENITY_BITS = {amenity: 1 << index for index, amenity in enumerate(AMENITIES)}
+
+# Constant-time membership checks for validation
+AMENITY_SET = frozenset(AMENITIES)
+
+# Lower edges of the price facet buckets; the last bucket has no upper bound
+PRICE_BUCKETS = [0, 500, 1000, 1500, 2000, 3000, 5000]
+
 LOCATIONS = [
     # Trinidad
     "Port of Spain",
@@ -71,4 +81,46 @@ LOCATIONS = [
     "Roxborough",
     "Charlotteville",
     "Speyside"
-]
\ No newline at end of file
+]
+
+LOCATION_SET = frozenset(LOCATIONS)
+
+# Approximate town-centre (latitude, longitude) of every entry in LOCATIONS,
+# used for apartments without coordinates of their own and for near= searches
+LOCATION_COORDINATES = {
+    "Port of Spain": (10.6549, -61.5019),
+    "San Fernando": (10.2797, -61.4684),
+    "Chaguanas": (10.5168, -61.4114),
+    "Arima": (10.6374, -61.2823),
+    "Marabella": (10.3063, -61.4470),
+    "Couva": (10.4229, -61.4546),
+    "Point Fortin": (10.1741, -61.6841),
+    "Tunapuna": (10.6520, -61.3886),
+    "Scarborough (Tobago)": (11.1823, -60.7350),
+    "Diego Martin": (10.7207, -61.5662),
+    "Sangre Grande": (10.5870, -61.1319),
+    "Princes Town": (10.2689, -61.3782),
+    "Rio Claro": (10.3059, -61.1756),
+    "Debe": (10.2022, -61.4480),
+    "Penal": (10.1689, -61.4658),
+    "Siparia": (10.1457, -61.5068),
+    "Arouca": (10.6289, -61.3342),
+    "St. Augustine": (10.6461, -61.3990),
+    "Curepe": (10.6361, -61.4092),
+    "St. James": (10.6697, -61.5377),
+    "Valsayn": (10.6403, -61.4170),
+    "Westmoorings": (10.6800, -61.5710),
+    "Goodwood Park": (10.6836, -61.5559),
+    "Glencoe": (10.6900, -61.5900),
+    "Santa Cruz": (10.7022, -61.4683),
+    "Crown Point": (11.1500, -60.8400),
+    "Buccoo": (11.1770, -60.8110),
+    "Plymouth": (11.2167, -60.7833),
+    "Black Rock": (11.2000, -60.7833),
+    "Lowlands": (11.1590, -60.7820),
+    "Mount Irvine": (11.1920, -60.7950),
+    "Belle Garden": (11.2330, -60.6500),
+    "Roxborough": (11.2500, -60.5833),
+    "Charlotteville": (11.3200, -60.5500),
+    "Speyside": (11.2980, -60.5360),
+}
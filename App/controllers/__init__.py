@@ -2,5 +2,11 @@ from .landlord import *
 from .tenant import *
 from .auth import *
 from .apartment import *
+from .geo import *
+from .search import *
+from .search_cache import *
+from .fragment_cache import *
 from .review import *
+from .bulk_import import *
+from .index_advisor import *
 from .initialize import *
\ No newline at end of file
@@ -1,44 +1,62 @@
 from App.models import Apartment, Landlord, Tenant, Review
-from App.database import db
-from App.constants import AMENITIES, LOCATIONS
-import hashlib
+from App.database import db, read_only
+from App.constants import AMENITIES, AMENITY_SET, LOCATIONS, LOCATION_SET, PRICE_BUCKETS
+from sqlalchemy import and_, case, cast, column, func, literal_column, table, true, tuple_
+import re
 
-# Function to generate a unique lease code
-def generate_lease_code(apartment):
-    data = f"{apartment.id}{apartment.title}{apartment.location}{apartment.price}"
-    return hashlib.md5(data.encode()).hexdigest()[:8]
+APARTMENTS_PER_PAGE = 12
+MAX_APARTMENTS_PER_PAGE = 100
+
+# Keyset columns for each listing order and whether that order is descending
+SORT_ORDERS = {
+    'newest': ((Apartment.id,), True),
+    'price_asc': ((Apartment.price, Apartment.id), False),
+    'price_desc': ((Apartment.price, Apartment.id), True),
+    # Mean rating from the stored aggregates; unreviewed apartments sort last
+    'rating': ((
+        case((Apartment.review_count > 0, cast(Apartment.rating_sum, db.Float) / Apartment.review_count), else_=0.0),
+        Apartment.id
+    ), True),
+}
+
+# FTS5 table kept in sync with apartment by triggers (see App.models.apartment)
+apartment_fts = table('apartment_fts', column('rowid'))
 
 # Create a new apartment (only landlords can create)
-def create_apartment(title, description, location, price, landlord_id, amenities):
+def create_apartment(title, description, location, price, landlord_id, amenities, latitude=None, longitude=None):
     landlord = Landlord.query.get(landlord_id)
     if not landlord:
         return None
 
-    if location not in LOCATIONS:
+    if location not in LOCATION_SET:
         return None
 
     for amenity in amenities:
-        if amenity not in AMENITIES:
+        if amenity not in AMENITY_SET:
             return None
 
+    try:
+        Apartment.validate_coordinates(latitude, longitude)
+    except ValueError:
+        return None
+
     apartment = Apartment(
         title=title,
         description=description,
         location=location,
         price=price,
         landlord_id=landlord_id,
-        amenities=amenities
+        amenities=amenities,
+        latitude=latitude,
+        longitude=longitude
     )
 
     db.session.add(apartment)
     db.session.commit()
-
-    apartment.lease_code = generate_lease_code(apartment)
-    db.session.commit()
-
     return apartment
 
 # Get all apartments
+@read_only
 def get_apartments():
     return Apartment.query.all()
 
@@ -79,40 +97,161 @@ def delete_apartment(id):
     return False
 
 def is_tenant_verified(tenant_id, lease_code):
-    tenant = Tenant.query.get(tenant_id)
-    if not tenant:
+    # The code names its apartment, so only the tenant needs loading
+    apartment_id = Apartment.lease_code_apartment_id(lease_code)
+    if apartment_id is None:
         return False
 
-    apartment = Apartment.query.filter_by(lease_code=lease_code).first()
-    if not apartment:
-        return False
+    tenant = Tenant.query.get(tenant_id)
+    return tenant is not None and tenant.apartment_id == apartment_id
+
+# Restrict a query to apartments matching keywords in their title or description.
+# Returns (query, rank) where a lower rank is a better match.
+def match_keywords(query, keywords):
+    if db.engine.dialect.name == 'postgresql':
+        document = func.to_tsvector(
+            literal_column("'english'::regconfig"),
+            Apartment.title + literal_column("' '") + Apartment.description
+        )
+        tsquery = func.websearch_to_tsquery(literal_column("'english'::regconfig"), keywords)
+        return query.filter(document.op('@@')(tsquery)), -func.ts_rank_cd(document, tsquery)
 
-    return tenant in apartment.tenants and apartment.id == tenant.apartment_id
+    # Quote each word so user input can never be parsed as FTS5 query syntax
+    terms = re.findall(r'\w+', keywords)
+    if not terms:
+        return query, None
+    match = ' '.join(f'"{term}"' for term in terms)
+    fts = literal_column('apartment_fts')
+    query = query.join(apartment_fts, apartment_fts.c.rowid == Apartment.id).filter(fts.op('MATCH')(match))
+    return query, func.bm25(fts)
 
-def search_apartments(filters):
-    query = Apartment.query
+# Build the SQL query for a search filter dict (q, location, amenities, min_price, max_price).
+# Returns (query, rank); rank is None unless the filters include keywords.
+def build_search_query(filters):
+    query, rank = Apartment.query, None
+
+    if filters.get('q'):
+        query, rank = match_keywords(query, filters['q'])
 
     if filters.get('location') and filters['location'] in LOCATIONS:
         query = query.filter(Apartment.location == filters['location'])
 
-    apartments = query.all()
-
     if filters.get('amenities'):
-        selected_amenities = set(filters['amenities'])
+        query = query.filter(Apartment.has_amenities(filters['amenities']))
+
+    if filters.get('min_price') is not None:
+        query = query.filter(Apartment.price >= filters['min_price'])
+
+    if filters.get('max_price') is not None:
+        query = query.filter(Apartment.price <= filters['max_price'])
 
-        def has_all_amenities(apartment):
-            return apartment.amenities and selected_amenities.issubset(set(apartment.amenities))
+    return query, rank
 
-        apartments = list(filter(has_all_amenities, apartments))
+# Shape facet counts (in LOCATIONS, AMENITIES and PRICE_BUCKETS order) for the API and templates
+def format_facets(total, location_counts, amenity_counts, bucket_counts):
+    bounds = PRICE_BUCKETS[1:] + [None]
+    return {
+        'total': total,
+        'locations': dict(zip(LOCATIONS, location_counts)),
+        'amenities': dict(zip(AMENITIES, amenity_counts)),
+        'price_buckets': [
+            {'min': low, 'max': high, 'count': count}
+            for low, high, count in zip(PRICE_BUCKETS, bounds, bucket_counts)
+        ]
+    }
 
-    return apartments
+# Count search facets with one aggregate query; each facet ignores its own filter
+def count_search_facets(filters):
+    query, _ = build_search_query({'q': filters.get('q')})
 
-# Get all reviews for a specific apartment
-def get_reviews_for_apartment(apartment_id):
-    reviews = Review.query.filter_by(apartment_id=apartment_id).all()
-    if not reviews:
+    location_ok = true()
+    if filters.get('location') and filters['location'] in LOCATIONS:
+        location_ok = Apartment.location == filters['location']
+    amenities_ok = Apartment.has_amenities(filters['amenities']) if filters.get('amenities') else true()
+    price_ok = and_(
+        Apartment.price >= filters['min_price'] if filters.get('min_price') is not None else true(),
+        Apartment.price <= filters['max_price'] if filters.get('max_price') is not None else true()
+    )
+
+    def count(*conditions):
+        return func.sum(case((and_(*conditions), 1), else_=0))
+
+    # The first bucket is open below, matching how the in-memory index buckets prices
+    def in_bucket(low, high):
+        return and_(
+            Apartment.price >= low if low != PRICE_BUCKETS[0] else true(),
+            Apartment.price < high if high is not None else true()
+        )
+
+    columns = [count(location_ok, amenities_ok, price_ok)]
+    columns += [count(amenities_ok, price_ok, Apartment.location == location) for location in LOCATIONS]
+    columns += [count(location_ok, amenities_ok, price_ok, Apartment.has_amenities([amenity])) for amenity in AMENITIES]
+    columns += [count(location_ok, amenities_ok, in_bucket(low, high))
+                for low, high in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None])]
+    counts = [value or 0 for value in query.with_entities(*columns).one()]
+
+    locations_end = 1 + len(LOCATIONS)
+    amenities_end = locations_end + len(AMENITIES)
+    return format_facets(counts[0], counts[1:locations_end], counts[locations_end:amenities_end], counts[amenities_end:])
+
+# Encode the keyset position of an apartment as an opaque cursor string
+def encode_cursor(key, sort):
+    if sort == 'newest':
+        return str(key[0])
+    return f"{key[0]!r}:{key[1]}"
+
+# Decode a cursor back into its key values, or None if it is malformed
+def decode_cursor(cursor, sort):
+    if not cursor:
         return None
-    return [review.get_json() for review in reviews]
+    try:
+        if sort == 'newest':
+            return (int(cursor),)
+        value, apartment_id = cursor.split(':')
+        return (float(value), int(apartment_id))
+    except ValueError:
+        return None
+
+# Keyset-paginate an apartment query; returns (apartments, next_cursor, prev_cursor).
+# Pass the rank from build_search_query to allow sort='relevance', the default when given.
+def paginate_apartments(query, sort=None, after=None, before=None, per_page=None, rank=None):
+    if sort is None:
+        sort = 'relevance' if rank is not None else 'newest'
+    if sort == 'relevance' and rank is not None:
+        columns, descending = (rank, Apartment.id), False
+    else:
+        if sort not in SORT_ORDERS:
+            sort = 'newest'
+        columns, descending = SORT_ORDERS[sort]
+    per_page = max(1, min(per_page or APARTMENTS_PER_PAGE, MAX_APARTMENTS_PER_PAGE))
+
+    # Paging backwards walks the index in the opposite direction, then flips the page
+    backwards = before is not None and after is None
+    cursor = decode_cursor(before if backwards else after, sort)
+    scan_descending = descending != backwards
+
+    if cursor is not None:
+        key, bound = tuple_(*columns), tuple_(*cursor)
+        query = query.filter(key < bound if scan_descending else key > bound)
+
+    query = query.add_columns(*columns)
+    query = query.order_by(*[column.desc() if scan_descending else column.asc() for column in columns])
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if not rows:
+        return [], None, None
+
+    if backwards:
+        rows.reverse()
+        next_cursor = encode_cursor(rows[-1][1:], sort)
+        prev_cursor = encode_cursor(rows[0][1:], sort) if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1][1:], sort) if has_more else None
+        prev_cursor = encode_cursor(rows[0][1:], sort) if cursor is not None else None
+
+    return [row[0] for row in rows], next_cursor, prev_cursor
 
 # Get all tenants of a specific apartment
 def get_all_tenants_of_apartment(apartment_id):
@@ -120,11 +259,12 @@ def get_all_tenants_of_apartment(apartment_id):
     if not apartment:
         return None
 
-    tenants = Tenant.query.join(Review).filter(Review.apartment_id == apartment_id).all()
+    tenants = Tenant.query.join(Review).filter(Review.apartment_id == apartment_id).order_by(Review.id).all()
     if not tenants:
         return None
 
     return [tenant.get_json() for tenant in tenants]
 
 def get_apartment_via_leasecode(leasecode):
-    return Apartment.query.filter_by(lease_code=leasecode).first()
+    apartment_id = Apartment.lease_code_apartment_id(leasecode)
+    return Apartment.query.get(apartment_id) if apartment_id is not None else None
@@ -1,4 +1,11 @@
-from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt_identity, verify_jwt_in_request
+from collections import OrderedDict, namedtuple
+import time
+
+from flask import current_app, g, has_app_context, has_request_context
+from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt, set_access_cookies, verify_jwt_in_request
+from sqlalchemy import event, null
+from sqlalchemy.orm import Session, object_session
+from App.database import db
 from App.models import Landlord, Tenant
 
 def login(username, password, role):
@@ -9,36 +16,206 @@ def login(username, password, role):
         user = Tenant.query.filter_by(username=username).first()
 
     if user and user.check_password(password):
+        save_rehashed_password(user)
         return create_access_token(identity=username)
     return None
 
 
-def setup_jwt(app):
-    jwt = JWTManager(app)
+def save_rehashed_password(user):
+    """Commit the new hash if check_password() just upgraded an outdated one."""
+    if db.session.is_modified(user):
+        db.session.commit()
+
+
+# Token claims describing the signed-in user; the subject itself is only their id
+IDENTITY_CLAIMS = ('role', 'username', 'apartment_id', 'has_reviewed')
+
+
+def identity_claims(role, user, has_reviewed=False):
+    """Extra token claims for a signed-in user.
 
-    # configure's flask jwt to resolve get_current_identity() to the corresponding user's ID
-    @jwt.user_identity_loader
-    def user_identity_lookup(identity):
-        landlord = Landlord.query.filter_by(username=identity).one_or_none()
-        if landlord:
-            return landlord.id
-        tenant = Tenant.query.filter_by(username=identity).one_or_none()
-        if tenant:
-            return tenant.id
+    Tenants also carry their apartment and whether they have reviewed it, so
+    their dashboard renders without looking either up.
+    """
+    claims = {'role': role, 'username': user.username}
+    if role == 'tenant':
+        claims.update(apartment_id=user.apartment_id, has_reviewed=has_reviewed)
+    return claims
+
+
+def create_identity_token(role, user, has_reviewed=False):
+    """An access token for a landlord or tenant.
+
+    The subject is the user id as a string, since PyJWT 2.10 and later reject
+    any other type; everything else goes in additional claims.
+    """
+    return create_access_token(identity=str(user.id), additional_claims=identity_claims(role, user, has_reviewed))
+
+
+def current_identity():
+    """The current token's {'id', 'role', 'username', ...}, or None without a signed-in user's token."""
+    token = get_jwt()
+    if 'role' not in token:
         return None
+    identity = {key: token[key] for key in IDENTITY_CLAIMS if key in token}
+    identity['id'] = int(token['sub'])
+    return identity
+
+
+def refresh_identity_cookie(response, **changes):
+    """Re-sign the current token's claims with changes and set it on the response."""
+    token = get_jwt()
+    claims = {key: token[key] for key in IDENTITY_CLAIMS if key in token}
+    claims.update(changes)
+    set_access_cookies(response, create_access_token(identity=token['sub'], additional_claims=claims))
+    return response
+
+
+'''
+Identity cache
+
+Authenticated requests only need a few columns of the signed-in user, so
+they are kept per worker as UserRecords in a small LRU keyed by (role, id),
+with a per-request memo in front. Landlord and tenant writes evict their
+entry once committed; the TTL bounds staleness from other workers' writes.
+'''
+
+# A lightweight, read-only view of a signed-in landlord or tenant; apartment_id is None for landlords
+UserRecord = namedtuple('UserRecord', ['id', 'role', 'username', 'email', 'apartment_id'])
+
+USER_MODELS = {'landlord': Landlord, 'tenant': Tenant}
+
+
+class IdentityCache:
+    """LRU of (role, id) -> UserRecord with a time-to-live."""
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            created_at, record = entry
+            if self.ttl is None or time.monotonic() - created_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return record
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, record):
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic(), record)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
 
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
+
+
+def get_identity_cache():
+    """The current app's identity cache, or None when IDENTITY_CACHE_ENABLED is off."""
+    if not current_app.config.get('IDENTITY_CACHE_ENABLED', True):
+        return None
+    cache = current_app.extensions.get('identity_cache')
+    if cache is None:
+        cache = IdentityCache(
+            current_app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 1024),
+            current_app.config.get('IDENTITY_CACHE_TTL', 300)
+        )
+        current_app.extensions['identity_cache'] = cache
+    return cache
+
+
+def _query_user_record(role, user_id):
+    model = USER_MODELS[role]
+    apartment_id = model.apartment_id if model is Tenant else null()
+    row = (model.query.with_entities(model.id, model.username, model.email, apartment_id)
+           .filter(model.id == user_id).first())
+    return UserRecord(row[0], role, row[1], row[2], row[3]) if row else None
+
+
+def load_user(role, user_id):
+    """The UserRecord for a landlord or tenant id, or None if there is no such user.
+
+    Answered from the request memo, then the worker's identity cache, and only
+    then with a single query.
+    """
+    if role not in USER_MODELS or user_id is None:
+        return None
+    key = (role, user_id)
+    memo = g.setdefault('identity_records', {}) if has_request_context() else {}
+    if key in memo:
+        return memo[key]
+
+    cache = get_identity_cache()
+    record = cache.get(key) if cache is not None else None
+    if record is None:
+        record = _query_user_record(role, user_id)
+        if record is not None and cache is not None:
+            cache.put(key, record)
+    memo[key] = record
+    return record
+
+
+def current_user_record():
+    """The signed-in user's UserRecord, for views behind @jwt_required()."""
+    identity = current_identity()
+    if identity is None:
+        return None
+    return load_user(identity['role'], identity['id'])
+
+
+@event.listens_for(Landlord, 'after_update')
+@event.listens_for(Landlord, 'after_delete')
+@event.listens_for(Tenant, 'after_update')
+@event.listens_for(Tenant, 'after_delete')
+def queue_identity_invalidation(mapper, connection, target):
+    role = 'landlord' if isinstance(target, Landlord) else 'tenant'
+    object_session(target).info.setdefault('identity_changes', set()).add((role, target.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_identity_invalidation(session):
+    changes = session.info.pop('identity_changes', None)
+    if not changes or not has_app_context():
+        return
+    cache = current_app.extensions.get('identity_cache')
+    memo = g.get('identity_records', {}) if has_request_context() else {}
+    for key in changes:
+        if cache is not None:
+            cache.invalidate(key)
+        memo.pop(key, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_identity_invalidation(session):
+    session.info.pop('identity_changes', None)
+
+
+def setup_jwt(app):
+    jwt = JWTManager(app)
+
+    # Tokens carry the user id as their subject and a role claim; resolve flask_jwt_extended.current_user from the identity cache
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
-        identity = jwt_data["sub"]
-        # First look for the user as a Landlord
-        landlord = Landlord.query.get(identity)
-        if landlord:
-            return landlord
-        # If not found, look for the user as a Tenant
-        tenant = Tenant.query.get(identity)
-        if tenant:
-            return tenant
-        return None
+        if 'role' not in jwt_data:
+            return None
+        return load_user(jwt_data['role'], int(jwt_data['sub']))
 
     return jwt
 
@@ -48,14 +225,8 @@ def add_auth_context(app):
     @app.context_processor
     def inject_user():
         try:
-            verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            current_user = Landlord.query.get(user_id)
-            if not current_user:
-                current_user = Tenant.query.get(user_id)
-            is_authenticated = True
-        except Exception as e:
-            print(e)
-            is_authenticated = False
+            verify_jwt_in_request(optional=True)
+            current_user = current_user_record()
+        except Exception:
             current_user = None
-        return dict(is_authenticated=is_authenticated, current_user=current_user)
+        return dict(is_authenticated=current_user is not None, current_user=current_user)
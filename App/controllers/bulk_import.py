@@ -0,0 +1,338 @@
+import csv
+import json
+from itertools import islice
+
+from collections import Counter
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from App.constants import AMENITY_SET, LOCATION_SET
+from App.database import db
+from App.models import Apartment, Landlord, LandlordStats, Tenant
+from App.models.landlord_stats import adjust_landlord_stats
+from App.passwords import hash_passwords
+from App.controllers.search import reset_apartment_snapshots
+
+'''
+Bulk import
+
+Onboards landlords, apartments and tenants from CSV or NDJSON. Input is read
+one row at a time and handled in batches: each batch is validated with a
+couple of IN queries, its passwords are hashed across the hashing pool, and
+its rows are inserted in a single transaction. Rows that fail validation are
+reported by line number and skipped; a batch the database rejects is rolled
+back and every row in it reported.
+
+Batches are written with one executemany INSERT rather than through the
+ORM, so the per-row flush hooks do not run. Each batch instead adjusts the
+landlord stats with one UPDATE per landlord it touches, and an apartment
+import resets the worker's search snapshots once it is done.
+'''
+
+IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_BATCH_SIZE = 5000
+IMPORT_ENTITIES = ('landlords', 'apartments', 'tenants')
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# Rows beyond this many failures are counted but not described
+MAX_REPORTED_ERRORS = 1000
+
+# CSV cells list several amenities separated by this
+AMENITY_SEPARATOR = ';'
+
+
+class ImportReport:
+    """Running totals and per-row errors for one import job."""
+
+    def __init__(self, entity):
+        self.entity = entity
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, line, *messages):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': list(messages)})
+
+    def get_json(self):
+        return {
+            'entity': self.entity,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def iter_records(stream, format):
+    """Yield (line, record) from a text stream; record is None for a row that could not be parsed."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError:
+                record = None
+            yield line, record if isinstance(record, dict) else None
+
+
+def _text(record, field):
+    value = record.get(field)
+    if value is None:
+        return ''
+    return value.strip() if isinstance(value, str) else str(value)
+
+
+def _required(record, fields):
+    return [f'{field} is required' for field in fields if not _text(record, field)]
+
+
+def _check_users(model, rows, report, extra_fields=()):
+    """Rows whose username and email are present and taken neither in the batch nor the table."""
+    candidates = []
+    for line, record in rows:
+        if record is None:
+            report.fail(line, 'Could not parse the row')
+            continue
+        errors = _required(record, ('username', 'email', 'password') + extra_fields)
+        if errors:
+            report.fail(line, *errors)
+        else:
+            candidates.append((line, record))
+
+    usernames = {_text(record, 'username') for _, record in candidates}
+    emails = {_text(record, 'email') for _, record in candidates}
+    taken_usernames, taken_emails = set(), set()
+    if candidates:
+        for username, email in (db.session.query(model.username, model.email)
+                                .filter(or_(model.username.in_(usernames), model.email.in_(emails)))):
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+    valid = []
+    for line, record in candidates:
+        username, email = _text(record, 'username'), _text(record, 'email')
+        errors = []
+        if username in taken_usernames:
+            errors.append(f'Username {username} is already taken')
+        if email in taken_emails:
+            errors.append(f'Email {email} is already registered')
+        if errors:
+            report.fail(line, *errors)
+            continue
+        # Later rows in the batch may not reuse them either
+        taken_usernames.add(username)
+        taken_emails.add(email)
+        valid.append((line, record))
+    return valid
+
+
+def _prepare_landlords(rows, report, landlord_id=None):
+    valid = _check_users(Landlord, rows, report)
+    hashes = hash_passwords([_text(record, 'password') for _, record in valid])
+    return [
+        (line, dict(username=_text(record, 'username'), email=_text(record, 'email'), password_hash=password_hash))
+        for (line, record), password_hash in zip(valid, hashes)
+    ]
+
+
+def _prepare_tenants(rows, report, landlord_id=None):
+    valid = []
+    apartment_ids = {}
+    for line, record in _check_users(Tenant, rows, report, extra_fields=('lease_code',)):
+        apartment_id = Apartment.lease_code_apartment_id(_text(record, 'lease_code'))
+        if apartment_id is None:
+            report.fail(line, 'Invalid lease code')
+            continue
+        apartment_ids[line] = apartment_id
+        valid.append((line, record))
+
+    existing = set(db.session.scalars(
+        select(Apartment.id).where(Apartment.id.in_(set(apartment_ids.values())))
+    )) if valid else set()
+    leased = []
+    for line, record in valid:
+        if apartment_ids[line] in existing:
+            leased.append((line, record))
+        else:
+            report.fail(line, 'Invalid lease code')
+
+    hashes = hash_passwords([_text(record, 'password') for _, record in leased])
+    return [
+        (line, dict(username=_text(record, 'username'), email=_text(record, 'email'),
+                    password_hash=password_hash, apartment_id=apartment_ids[line]))
+        for (line, record), password_hash in zip(leased, hashes)
+    ]
+
+
+def _amenities(value):
+    if isinstance(value, list):
+        return [str(amenity).strip() for amenity in value]
+    if not value:
+        return []
+    return [amenity.strip() for amenity in str(value).split(AMENITY_SEPARATOR) if amenity.strip()]
+
+
+def _number(record, field, errors):
+    text = _text(record, field)
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        errors.append(f'{field} must be a number')
+        return None
+
+
+def _prepare_apartments(rows, report, landlord_id=None):
+    """Apartments name their landlord by landlord_id or landlord (username), unless landlord_id is forced."""
+    parsed = []
+    for line, record in rows:
+        if record is None:
+            report.fail(line, 'Could not parse the row')
+            continue
+        errors = _required(record, ('title', 'description', 'location', 'price'))
+        if landlord_id is None and not (_text(record, 'landlord_id') or _text(record, 'landlord')):
+            errors.append('landlord_id or landlord is required')
+
+        location = _text(record, 'location')
+        if location and location not in LOCATION_SET:
+            errors.append(f'Invalid location: {location}')
+        amenities = _amenities(record.get('amenities'))
+        invalid = [amenity for amenity in amenities if amenity not in AMENITY_SET]
+        if invalid:
+            errors.append(f'Invalid amenities: {invalid}')
+        price = _number(record, 'price', errors)
+        if price is not None and price < 0:
+            errors.append('price must not be negative')
+        latitude = _number(record, 'latitude', errors)
+        longitude = _number(record, 'longitude', errors)
+        try:
+            Apartment.validate_coordinates(latitude, longitude)
+        except ValueError as e:
+            errors.append(str(e))
+
+        if errors:
+            report.fail(line, *errors)
+        else:
+            parsed.append((line, record, dict(
+                title=_text(record, 'title'), description=_text(record, 'description'), location=location,
+                price=price, amenity_mask=Apartment.amenities_to_mask(amenities), latitude=latitude, longitude=longitude
+            )))
+
+    owners = {}
+    if landlord_id is None and parsed:
+        ids = {int(_text(record, 'landlord_id')) for _, record, _ in parsed if _text(record, 'landlord_id').isdigit()}
+        names = {_text(record, 'landlord') for _, record, _ in parsed if _text(record, 'landlord')}
+        for owner_id, username in (db.session.query(Landlord.id, Landlord.username)
+                                   .filter(or_(Landlord.id.in_(ids), Landlord.username.in_(names)))):
+            owners[str(owner_id)] = owner_id
+            owners[username] = owner_id
+
+    prepared = []
+    for line, record, values in parsed:
+        owner_id = landlord_id
+        if owner_id is None:
+            owner = _text(record, 'landlord_id') or _text(record, 'landlord')
+            owner_id = owners.get(owner)
+            if owner_id is None:
+                report.fail(line, f'No landlord {owner}')
+                continue
+        prepared.append((line, dict(values, landlord_id=owner_id)))
+    return prepared
+
+
+PREPARERS = {
+    'landlords': _prepare_landlords,
+    'apartments': _prepare_apartments,
+    'tenants': _prepare_tenants,
+}
+
+
+def _insert_landlords(rows):
+    landlord_ids = db.session.scalars(insert(Landlord).returning(Landlord.id), rows).all()
+    db.session.execute(insert(LandlordStats), [{'landlord_id': landlord_id} for landlord_id in landlord_ids])
+
+
+def _insert_apartments(rows):
+    db.session.execute(insert(Apartment), rows)
+    listings, prices = Counter(), Counter()
+    for row in rows:
+        listings[row['landlord_id']] += 1
+        prices[row['landlord_id']] += row['price']
+    connection = db.session.connection()
+    for landlord_id, count in listings.items():
+        adjust_landlord_stats(connection, landlord_id, listing_count=count, price_sum=prices[landlord_id])
+
+
+def _insert_tenants(rows):
+    tenants = Counter(row['apartment_id'] for row in rows)
+    # Apartments without tenants before this batch become occupied
+    occupied = set(db.session.scalars(
+        select(Tenant.apartment_id).where(Tenant.apartment_id.in_(tenants)).distinct()
+    ))
+    owners = dict(db.session.execute(select(Apartment.id, Apartment.landlord_id).where(Apartment.id.in_(tenants))).all())
+    db.session.execute(insert(Tenant), rows)
+    tenant_counts, occupied_counts = Counter(), Counter()
+    for apartment_id, count in tenants.items():
+        tenant_counts[owners[apartment_id]] += count
+        if apartment_id not in occupied:
+            occupied_counts[owners[apartment_id]] += 1
+    connection = db.session.connection()
+    for landlord_id, count in tenant_counts.items():
+        adjust_landlord_stats(connection, landlord_id, tenant_count=count, occupied_count=occupied_counts[landlord_id])
+
+
+INSERTERS = {
+    'landlords': _insert_landlords,
+    'apartments': _insert_apartments,
+    'tenants': _insert_tenants,
+}
+
+
+def import_records(entity, records, batch_size=IMPORT_BATCH_SIZE, landlord_id=None):
+    """Insert (line, record) pairs of an entity in batches, one transaction each.
+
+    landlord_id, if given, owns every imported apartment regardless of the
+    rows. Returns an ImportReport.
+    """
+    prepare, insert_rows = PREPARERS[entity], INSERTERS[entity]
+    report = ImportReport(entity)
+    records = iter(records)
+    try:
+        while True:
+            rows = list(islice(records, batch_size))
+            if not rows:
+                return report
+            prepared = prepare(rows, report, landlord_id)
+            if not prepared:
+                continue
+            try:
+                insert_rows([values for _, values in prepared])
+                db.session.commit()
+                report.imported += len(prepared)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                message = f'Batch rejected by the database: {e.__class__.__name__}'
+                for line, _ in prepared:
+                    report.fail(line, message)
+    finally:
+        # The inserts skipped the hooks that keep the index, grid and ranking arrays current
+        if entity == 'apartments' and report.imported:
+            reset_apartment_snapshots()
+
+
+def import_file(entity, stream, format, batch_size=IMPORT_BATCH_SIZE, landlord_id=None):
+    """Stream-import a CSV or NDJSON text stream of one entity; returns the report as JSON."""
+    if entity not in PREPARERS:
+        raise ValueError(f'Unknown entity: {entity}. Must be one of {IMPORT_ENTITIES}.')
+    if format not in IMPORT_FORMATS:
+        raise ValueError(f'Unknown format: {format}. Must be one of {IMPORT_FORMATS}.')
+    return import_records(entity, iter_records(stream, format), batch_size, landlord_id).get_json()
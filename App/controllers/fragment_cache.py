@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """LRU of rendered template fragments.
+
+    Keys embed the version of whatever the fragment shows (e.g. an
+    apartment's version column), so a write simply makes the old entry
+    unreachable; it ages out of the LRU instead of being invalidated.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        html = self._entries.get(key)
+        if html is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return html
+
+    def put(self, key, html):
+        self._entries[key] = html
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
+
+
+def get_fragment_cache():
+    """The current app's fragment cache, or None when FRAGMENT_CACHE_ENABLED is off."""
+    if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+        return None
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        cache = FragmentCache(current_app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 1024))
+        current_app.extensions['fragment_cache'] = cache
+    return cache
+
+
+def cached_fragment(key, render):
+    """The fragment cached under key, calling render() to produce and store it on a miss."""
+    cache = get_fragment_cache()
+    html = cache.get(key) if cache is not None else None
+    if html is None:
+        html = Markup(render())
+        if cache is not None:
+            cache.put(key, html)
+    return html
@@ -0,0 +1,166 @@
+from math import asin, cos, floor, radians, sin, sqrt
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from App.models import Apartment
+from App.database import db, primary_session
+from App.constants import LOCATION_COORDINATES
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+# Side of a grid cell in degrees (about 5.5 km north-south)
+GRID_CELL_DEGREES = 0.05
+
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 100
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres."""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def _cell(latitude, longitude):
+    return (floor(latitude / GRID_CELL_DEGREES), floor(longitude / GRID_CELL_DEGREES))
+
+
+class ApartmentGrid:
+    """Process-local uniform grid over apartment coordinates.
+
+    Points are bucketed into GRID_CELL_DEGREES cells, so a radius query only
+    visits the cells overlapping the radius' bounding box before the exact
+    haversine check.
+    """
+
+    def __init__(self):
+        self.built_at = None
+        self._cells = {}
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def build(self, rows):
+        """Rebuild from (id, location, latitude, longitude) rows."""
+        self.__init__()
+        for apartment_id, location, latitude, longitude in rows:
+            point = Apartment.resolve_coordinates(location, latitude, longitude)
+            if point is not None:
+                self.add(apartment_id, *point)
+        self.built_at = time.monotonic()
+
+    def is_stale(self, max_age):
+        return max_age is not None and time.monotonic() - self.built_at > max_age
+
+    def add(self, apartment_id, latitude, longitude):
+        """Insert or move a single apartment."""
+        self.remove(apartment_id)
+        cell = _cell(latitude, longitude)
+        self._cells.setdefault(cell, {})[apartment_id] = (latitude, longitude)
+        self._points[apartment_id] = cell
+
+    def remove(self, apartment_id):
+        cell = self._points.pop(apartment_id, None)
+        if cell is None:
+            return
+        points = self._cells[cell]
+        del points[apartment_id]
+        if not points:
+            del self._cells[cell]
+
+    def _candidate_cells(self, latitude, longitude, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles; size the box for the widest latitude it covers
+        widest = min(abs(latitude) + lat_span, 89.9)
+        lon_span = radius_km / (KM_PER_DEGREE * cos(radians(widest)))
+        low_row, low_col = _cell(latitude - lat_span, longitude - lon_span)
+        high_row, high_col = _cell(latitude + lat_span, longitude + lon_span)
+
+        # Huge radii cover more cells than exist; filter the occupied cells instead
+        if (high_row - low_row + 1) * (high_col - low_col + 1) > len(self._cells):
+            for (row, col), points in self._cells.items():
+                if low_row <= row <= high_row and low_col <= col <= high_col:
+                    yield points
+            return
+        for row in range(low_row, high_row + 1):
+            for col in range(low_col, high_col + 1):
+                points = self._cells.get((row, col))
+                if points:
+                    yield points
+
+    def within(self, latitude, longitude, radius_km):
+        """(distance_km, id) of every apartment within radius_km, nearest first."""
+        matches = []
+        for points in self._candidate_cells(latitude, longitude, radius_km):
+            for apartment_id, (point_latitude, point_longitude) in points.items():
+                distance = haversine_km(latitude, longitude, point_latitude, point_longitude)
+                if distance <= radius_km:
+                    matches.append((distance, apartment_id))
+        matches.sort()
+        return matches
+
+
+def get_apartment_grid():
+    """The current app's spatial grid, built from the database on first use."""
+    grid = current_app.extensions.get('apartment_grid')
+    if grid is None or grid.is_stale(current_app.config.get('APARTMENT_INDEX_MAX_AGE')):
+        grid = ApartmentGrid()
+        with primary_session():
+            grid.build(db.session.query(Apartment.id, Apartment.location, Apartment.latitude, Apartment.longitude))
+        current_app.extensions['apartment_grid'] = grid
+    return grid
+
+
+# (distance_km, id) of apartments within the filters' radius of the near= location, nearest first
+def apartments_near(filters):
+    centre = LOCATION_COORDINATES.get(filters.get('near'))
+    if centre is None:
+        return []
+    radius_km = min(filters.get('radius_km') or DEFAULT_RADIUS_KM, MAX_RADIUS_KM)
+    return get_apartment_grid().within(*centre, radius_km)
+
+
+'''
+Grid maintenance
+
+Mirrors the apartment index: flush events record each apartment's new
+position on the session and the grid is updated once the transaction commits.
+'''
+
+@event.listens_for(Apartment, 'after_insert')
+@event.listens_for(Apartment, 'after_update')
+def queue_apartment_grid_update(mapper, connection, target):
+    changes = object_session(target).info.setdefault('apartment_grid_changes', {})
+    changes[target.id] = target.coordinates
+
+
+@event.listens_for(Apartment, 'after_delete')
+def queue_apartment_grid_delete(mapper, connection, target):
+    changes = object_session(target).info.setdefault('apartment_grid_changes', {})
+    changes[target.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_apartment_grid_changes(session):
+    changes = session.info.pop('apartment_grid_changes', None)
+    if not changes or not has_app_context():
+        return
+    grid = current_app.extensions.get('apartment_grid')
+    if grid is None:
+        return
+    for apartment_id, point in changes.items():
+        if point is None:
+            grid.remove(apartment_id)
+        else:
+            grid.add(apartment_id, *point)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_apartment_grid_changes(session):
+    session.info.pop('apartment_grid_changes', None)
@@ -0,0 +1,142 @@
+from collections import namedtuple
+from datetime import date
+import re
+
+from alembic import command
+from alembic.operations import ops
+from flask import current_app
+from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from App.constants import LOCATIONS
+from App.database import db
+from App.models import Apartment, Landlord, RatingRollup, Review, Tenant
+from App.controllers.apartment import SORT_ORDERS
+from App.controllers.review import REVIEW_SORT_ORDERS
+
+'''
+Index advisor
+
+Replays the statements behind the app's hot paths through the database's
+planner (EXPLAIN QUERY PLAN on SQLite, EXPLAIN on Postgres) and flags those
+that read a whole table. Each query shape names the index that would serve
+it, so flagged shapes turn straight into CREATE INDEX operations for an
+Alembic revision.
+'''
+
+# name: what the app does; build: a function returning the statement; index: (table, columns) that serves it
+QueryShape = namedtuple('QueryShape', ['name', 'build', 'index'])
+
+# A shape's outcome: plan is the planner's output, one step per line; scans lists fully read tables
+Advice = namedtuple('Advice', ['shape', 'plan', 'scans', 'recommendation', 'error'])
+
+
+def _ordered(query, sort_orders, sort):
+    columns, descending = sort_orders[sort]
+    return query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+
+QUERY_SHAPES = [
+    QueryShape('landlord login', lambda: select(Landlord).where(Landlord.username == 'bob'),
+               ('landlord', ('username',))),
+    QueryShape('tenant login', lambda: select(Tenant).where(Tenant.username == 'john_doe'),
+               ('tenant', ('username',))),
+    QueryShape('lease code lookup', lambda: select(Apartment).where(Apartment.id == 1), None),
+    QueryShape('search by location, cheapest first',
+               lambda: _ordered(select(Apartment.id).where(Apartment.location == LOCATIONS[0],
+                                                           Apartment.price.between(500, 2000)),
+                                SORT_ORDERS, 'price_asc').limit(13),
+               ('apartment', ('location', 'price', 'id'))),
+    QueryShape('search by price, cheapest first',
+               lambda: _ordered(select(Apartment.id).where(Apartment.price >= 1000), SORT_ORDERS, 'price_asc').limit(13),
+               ('apartment', ('price', 'id'))),
+    QueryShape('review listing, newest first',
+               lambda: _ordered(select(Review).where(Review.apartment_id == 1), REVIEW_SORT_ORDERS, 'newest').limit(11),
+               ('review', ('apartment_id', 'created_at', 'id'))),
+    QueryShape('review listing, best first',
+               lambda: _ordered(select(Review).where(Review.apartment_id == 1), REVIEW_SORT_ORDERS, 'rating_desc').limit(11),
+               ('review', ('apartment_id', 'rating', 'id'))),
+    QueryShape('tenant reviews', lambda: select(Review).where(Review.tenant_id == 1), ('review', ('tenant_id',))),
+    QueryShape('has reviewed', lambda: select(Review.id).where(Review.tenant_id == 1, Review.apartment_id == 1),
+               ('review', ('tenant_id', 'apartment_id'))),
+    QueryShape('landlord dashboard listings', lambda: select(Apartment).where(Apartment.landlord_id == 1),
+               ('apartment', ('landlord_id',))),
+    QueryShape('apartment tenants', lambda: select(Tenant).where(Tenant.apartment_id == 1),
+               ('tenant', ('apartment_id',))),
+    QueryShape('rating time series',
+               lambda: select(RatingRollup).where(RatingRollup.apartment_id == 1,
+                                                  RatingRollup.day.between(date(2024, 1, 1), date(2024, 12, 31))),
+               ('rating_rollup', ('apartment_id', 'day'))),
+]
+
+# SQLite reports "SCAN <table>" for a full read; an index or rowid search says "SEARCH"
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?! USING (?:COVERING )?INDEX)(?! VIRTUAL TABLE)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def _explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).fetchall()
+        plan = [row[-1] for row in rows]
+        scans = [match.group(1) for match in map(SQLITE_SCAN.match, plan) if match]
+    else:
+        # Tiny tables are always cheaper to read whole; make the planner show whether an index is usable
+        connection.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = [row[0] for row in connection.execute(text(f'EXPLAIN {compiled}'))]
+        scans = [match.group(1) for match in map(POSTGRES_SCAN.search, plan) if match]
+    return plan, scans
+
+
+def index_name(table, columns):
+    return f"ix_{table}_{'_'.join(columns)}"
+
+
+def advise_indexes(shapes=QUERY_SHAPES):
+    """EXPLAIN every query shape; returns a list of Advice, in shape order.
+
+    A shape whose planned statement reads its index table in full gets that
+    index as its recommendation.
+    """
+    advice = []
+    with db.engine.connect() as connection:
+        for shape in shapes:
+            transaction = connection.begin()
+            try:
+                plan, scans = _explain(connection, shape.build())
+                error = None
+            except SQLAlchemyError as e:
+                plan, scans, error = [], [], str(e.orig if hasattr(e, 'orig') else e).splitlines()[0]
+            finally:
+                transaction.rollback()
+            recommendation = shape.index if shape.index and shape.index[0] in scans else None
+            advice.append(Advice(shape, plan, scans, recommendation, error))
+    return advice
+
+
+def recommended_indexes(advice):
+    """The distinct (name, table, columns) recommended across a list of Advice."""
+    indexes = {}
+    for item in advice:
+        if item.recommendation:
+            table, columns = item.recommendation
+            indexes.setdefault(index_name(table, columns), (table, columns))
+    return [(name, table, columns) for name, (table, columns) in indexes.items()]
+
+
+def write_index_migration(indexes, message='add recommended indexes'):
+    """Generate an Alembic revision creating the indexes; returns the new script's path."""
+    def add_index_ops(context, revision, directives):
+        script = directives[0]
+        script.upgrade_ops.ops[:] = [
+            ops.CreateIndexOp(name, table, list(columns)) for name, table, columns in indexes
+        ]
+        script.downgrade_ops.ops[:] = [
+            ops.DropIndexOp(name, table_name=table) for name, table, _ in reversed(indexes)
+        ]
+
+    config = current_app.extensions['migrate'].migrate.get_config()
+    # The revision must run env.py for Alembic to render the operations
+    config.set_main_option('revision_environment', 'true')
+    script = command.revision(config, message=message, process_revision_directives=add_index_ops)
+    return script.path
@@ -3,6 +3,8 @@ from App.models.landlord import Landlord
 from App.models.tenant import Tenant
 from App.models.apartment import Apartment
 from App.models.review import Review
+from App.models.landlord_stats import LandlordStats
+from App.models.rating_rollup import RatingRollup
 
 from App.controllers.landlord import create_landlord
 from App.controllers.tenant import create_tenant
@@ -11,9 +13,20 @@ from App.controllers.review import create_review
 
 from App.database import db
 from App.constants import AMENITIES, LOCATIONS
+from App.passwords import hash_passwords
 from App.sampledata import *
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
 import random
 
+# Rows per bulk insert and transaction when generating synthetic data
+SYNTHETIC_CHUNK_SIZE = 10000
+# Synthetic reviews are spread over this many days before SYNTHETIC_EPOCH
+SYNTHETIC_REVIEW_DAYS = 365
+# A fixed end date, so a seed gives the same review timestamps whenever it is run
+SYNTHETIC_EPOCH = datetime(2025, 1, 1)
+
 
 def initialize_sample_data_SOME():
     try:
@@ -141,8 +154,167 @@ def initialize_sample_data_ALL():
         print(f"Error initializing sample data: {e}")
 
 
-def initialize():
+'''
+Synthetic data
+
+initialize_synthetic_data() reproduces initialize_sample_data_ALL() at scale
+times the size of App/sampledata: every landlord, apartment and tenant row is
+repeated scale times, apartments get random landlords, locations and 10
+amenities, and every tenant a random apartment and one review. Everything is
+drawn from one seeded generator, so a seed always gives the same dataset.
+
+Rows go in with bulk INSERTs of explicit ids, one transaction per chunk, and
+skip the ORM; on Postgres the id sequences are then moved past them. The
+aggregates the ORM hooks would maintain (apartment ratings, rating rollups,
+landlord stats) are tallied while generating and written alongside. Users
+share one hash per sample password, computed once.
+'''
+
+def _scaled(value, copy):
+    # The first copy keeps the sample names, so the sample logins still work
+    if not copy:
+        return value
+    if '@' in value:
+        local, domain = value.split('@', 1)
+        return f"{local}+{copy}@{domain}"
+    return f"{value}_{copy}"
+
+
+def _insert(model, rows):
+    if rows:
+        db.session.execute(insert(model.__table__), rows)
+        rows.clear()
+
+
+def _advance_id_sequences(models):
+    # Explicit ids leave Postgres serial sequences behind, and the next ORM insert would collide
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__tablename__
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 1), max(id) IS NOT NULL) FROM {table}"
+        ))
+    db.session.commit()
+
+
+def initialize_synthetic_data(scale, seed=0, chunk_size=SYNTHETIC_CHUNK_SIZE, until=None):
+    """Generate scale times the sample data; returns the number of rows written per table."""
+    rng = random.Random(seed)
+    until = until or SYNTHETIC_EPOCH
+    landlord_total = len(LANDLORDS_DATA) * scale
+    apartment_total = len(APARTMENTS_DATA) * scale
+    tenant_total = len(TENANTS_DATA) * scale
+
+    landlord_hashes = hash_passwords([password for _, _, password in LANDLORDS_DATA])
+    tenant_hashes = hash_passwords([password for _, _, password in TENANTS_DATA])
+
+    rows = []
+    for index in range(landlord_total):
+        username, email, _ = LANDLORDS_DATA[index % len(LANDLORDS_DATA)]
+        copy = index // len(LANDLORDS_DATA)
+        rows.append({'id': index + 1, 'username': _scaled(username, copy), 'email': _scaled(email, copy),
+                     'password_hash': landlord_hashes[index % len(LANDLORDS_DATA)]})
+        if len(rows) >= chunk_size:
+            _insert(Landlord, rows)
+            db.session.commit()
+    _insert(Landlord, rows)
+    db.session.commit()
+
+    # Tenants are written apartment by apartment, so each apartment's ratings and
+    # rollups are complete when it is written; sort the drawn tenants to match
+    tenant_apartments = array('l', (rng.randrange(apartment_total) for _ in range(tenant_total)))
+    starts = array('l', [0] * (apartment_total + 1))
+    for apartment_index in tenant_apartments:
+        starts[apartment_index + 1] += 1
+    for apartment_index in range(apartment_total):
+        starts[apartment_index + 1] += starts[apartment_index]
+    filled = array('l', starts[:-1])
+    tenants_by_apartment = array('l', [0] * tenant_total)
+    for tenant_index, apartment_index in enumerate(tenant_apartments):
+        tenants_by_apartment[filled[apartment_index]] = tenant_index
+        filled[apartment_index] += 1
+    del tenant_apartments, filled
+
+    landlord_stats = [[0, 0, 0, 0.0, 0, 0] for _ in range(landlord_total)]
+    apartments, tenants, reviews, rollups = [], [], [], []
+    written = {'landlord': landlord_total, 'apartment': apartment_total, 'tenant': tenant_total,
+               'review': 0, 'rating_rollup': 0}
+    for apartment_index in range(apartment_total):
+        apartment_id = apartment_index + 1
+        title, description, price = APARTMENTS_DATA[apartment_index % len(APARTMENTS_DATA)]
+        landlord_index = rng.randrange(landlord_total)
+        location = rng.choice(LOCATIONS)
+        amenities = rng.sample(AMENITIES, 10)
+
+        ratings = [0] * 6
+        days = {}
+        residents = tenants_by_apartment[starts[apartment_index]:starts[apartment_index + 1]]
+        for tenant_index in residents:
+            username, email, _ = TENANTS_DATA[tenant_index % len(TENANTS_DATA)]
+            copy = tenant_index // len(TENANTS_DATA)
+            tenants.append({'id': tenant_index + 1, 'username': _scaled(username, copy), 'email': _scaled(email, copy),
+                            'password_hash': tenant_hashes[tenant_index % len(TENANTS_DATA)],
+                            'apartment_id': apartment_id})
+
+            comment, rating = rng.choice(REVIEWS_DATA)
+            created_at = until - timedelta(seconds=rng.randrange(SYNTHETIC_REVIEW_DAYS * 86400))
+            written['review'] += 1
+            reviews.append({'id': written['review'], 'tenant_id': tenant_index + 1, 'apartment_id': apartment_id,
+                            'rating': rating, 'comment': comment, 'created_at': created_at})
+            ratings[rating] += 1
+            day = days.setdefault(created_at.date(), [0, 0])
+            day[0] += 1
+            day[1] += rating
+
+        review_count = sum(ratings)
+        rating_sum = sum(rating * count for rating, count in enumerate(ratings))
+        apartments.append({
+            'id': apartment_id, 'title': title, 'description': description, 'location': location, 'price': price,
+            'landlord_id': landlord_index + 1, 'amenity_mask': Apartment.amenities_to_mask(amenities),
+            'review_count': review_count, 'rating_sum': rating_sum,
+            'rating_1': ratings[1], 'rating_2': ratings[2], 'rating_3': ratings[3],
+            'rating_4': ratings[4], 'rating_5': ratings[5],
+            'version': 1,
+        })
+        rollups.extend({'apartment_id': apartment_id, 'day': day, 'count': count, 'rating_sum': total}
+                       for day, (count, total) in days.items())
+        written['rating_rollup'] += len(days)
+
+        stats = landlord_stats[landlord_index]
+        stats[0] += 1
+        stats[1] += 1 if residents else 0
+        stats[2] += len(residents)
+        stats[3] += price
+        stats[4] += review_count
+        stats[5] += rating_sum
+
+        if len(apartments) + len(tenants) >= chunk_size or apartment_id == apartment_total:
+            # Parents first, so the chunk also loads into a database that enforces foreign keys
+            _insert(Apartment, apartments)
+            _insert(Tenant, tenants)
+            _insert(Review, reviews)
+            _insert(RatingRollup, rollups)
+            db.session.commit()
+
+    for index, (listing_count, occupied_count, tenant_count, price_sum, review_count, rating_sum) in enumerate(landlord_stats):
+        rows.append({'landlord_id': index + 1, 'listing_count': listing_count, 'occupied_count': occupied_count,
+                     'tenant_count': tenant_count, 'price_sum': price_sum, 'review_count': review_count,
+                     'rating_sum': rating_sum})
+        if len(rows) >= chunk_size:
+            _insert(LandlordStats, rows)
+            db.session.commit()
+    _insert(LandlordStats, rows)
+    db.session.commit()
+    _advance_id_sequences((Landlord, Apartment, Tenant, Review))
+    written['landlord_stats'] = landlord_total
+    return written
+
+
+def initialize(scale=None, seed=0):
     db.drop_all()
     db.create_all()
     #initialize_sample_data_SOME()
+    if scale:
+        return initialize_synthetic_data(scale, seed)
     initialize_sample_data_ALL()
@@ -1,6 +1,9 @@
 from App.database import db
-from App.models import Landlord
+from App.models import Landlord, LandlordStats, Apartment, Tenant, LANDLORD_STATS_COLUMNS
 from App.controllers.apartment import create_apartment
+from sqlalchemy import func
+
+RECONCILE_BATCH_SIZE = 500
 
 def create_landlord(username, email, password):
     landlord = Landlord(username=username, email=email, password=password)
@@ -22,3 +25,56 @@ def get_all_landlords():
 
 def get_all_landlords_json():
     return [landlord.get_json() for landlord in Landlord.query.all()]
+
+def get_landlord_stats(landlord_id):
+    stats = LandlordStats.query.get(landlord_id)
+    return stats.get_json() if stats else None
+
+# Rebuild every landlord's stats row from the apartment and tenant tables, committing
+# one batch of landlords at a time. Returns the number of rows created or corrected.
+def reconcile_landlord_stats(batch_size=RECONCILE_BATCH_SIZE):
+    repaired, last_id = 0, 0
+    while True:
+        landlord_ids = [row[0] for row in db.session.query(Landlord.id)
+                        .filter(Landlord.id > last_id).order_by(Landlord.id).limit(batch_size)]
+        if not landlord_ids:
+            return repaired
+        last_id = landlord_ids[-1]
+
+        # Review totals come from the apartments' own rating aggregates
+        listings = {
+            row[0]: row[1:]
+            for row in db.session.query(
+                Apartment.landlord_id, func.count(Apartment.id), func.sum(Apartment.price),
+                func.sum(Apartment.review_count), func.sum(Apartment.rating_sum)
+            ).filter(Apartment.landlord_id.in_(landlord_ids)).group_by(Apartment.landlord_id)
+        }
+        tenants = {
+            row[0]: row[1:]
+            for row in db.session.query(
+                Apartment.landlord_id, func.count(func.distinct(Tenant.apartment_id)), func.count(Tenant.id)
+            ).join(Tenant, Tenant.apartment_id == Apartment.id)
+            .filter(Apartment.landlord_id.in_(landlord_ids)).group_by(Apartment.landlord_id)
+        }
+        existing = {stats.landlord_id: stats for stats in LandlordStats.query.filter(LandlordStats.landlord_id.in_(landlord_ids))}
+
+        for landlord_id in landlord_ids:
+            listing_count, price_sum, review_count, rating_sum = listings.get(landlord_id, (0, 0, 0, 0))
+            occupied_count, tenant_count = tenants.get(landlord_id, (0, 0))
+            values = dict(listing_count=listing_count, occupied_count=occupied_count, tenant_count=tenant_count,
+                          price_sum=price_sum or 0, review_count=review_count or 0, rating_sum=rating_sum or 0)
+
+            stats = existing.get(landlord_id)
+            if stats is None:
+                stats = LandlordStats(landlord_id)
+                db.session.add(stats)
+            elif all(
+                # The price sum is a float that accumulates rounding error between reconciles
+                abs(getattr(stats, name) - value) < 0.005 if name == 'price_sum' else getattr(stats, name) == value
+                for name, value in values.items()
+            ):
+                continue
+            for name in LANDLORD_STATS_COLUMNS:
+                setattr(stats, name, values[name])
+            repaired += 1
+        db.session.commit()
@@ -0,0 +1,331 @@
+import time
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from App.models import Apartment, Review
+from App.database import db, primary_session, stored_value
+from App.constants import AMENITY_BITS, LOCATIONS
+from App.controllers.apartment import (
+    APARTMENTS_PER_PAGE,
+    MAX_APARTMENTS_PER_PAGE,
+    build_search_query,
+    decode_cursor,
+    encode_cursor
+)
+from App.controllers.search_cache import bump_rating_generation
+
+# Weight of each component of the relevance score; each component lies in [0, 1]
+RANK_WEIGHTS = {'amenities': 1.0, 'rating': 1.0, 'price': 1.0}
+
+# Rating assumed for apartments with no reviews at all
+DEFAULT_RATING = 3.0
+
+
+def _count_bits(masks, wanted):
+    """Number of the bits of wanted set in each mask."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks & np.int64(wanted))
+    counts = np.zeros(len(masks), dtype=np.int64)
+    for bit in AMENITY_BITS.values():
+        if wanted & bit:
+            counts += (masks & bit) != 0
+    return counts
+
+
+def _amenity_mask(amenities):
+    mask = 0
+    for amenity in amenities or []:
+        mask |= AMENITY_BITS.get(amenity, 0)
+    return mask
+
+
+def _top(scores, ids, count):
+    """Positions of the count best entries by (score desc, id asc), best first.
+
+    A partial sort finds the cut-off score so only entries at or above it
+    (including every tie at the cut-off) are fully ordered.
+    """
+    if len(scores) > count:
+        cutoff = np.partition(scores, len(scores) - count)[len(scores) - count]
+        positions = np.flatnonzero(scores >= cutoff)
+    else:
+        positions = np.arange(len(scores))
+    order = np.lexsort((ids[positions], -scores[positions]))
+    return positions[order[:count]]
+
+
+class ApartmentScores:
+    """Per-apartment column arrays, sorted by id, for vectorized ranking.
+
+    Holds each apartment's location code, amenity mask, price and review
+    rating sum/count so a whole candidate set is filtered and scored with
+    array operations instead of per-row Python.
+    """
+
+    def __init__(self):
+        self.built_at = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.locations = np.zeros(0, dtype=np.int16)
+        self.masks = np.zeros(0, dtype=np.int64)
+        self.prices = np.zeros(0, dtype=np.float64)
+        self.rating_sums = np.zeros(0, dtype=np.float64)
+        self.rating_counts = np.zeros(0, dtype=np.float64)
+        self.mean_rating = DEFAULT_RATING
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, rows, ratings):
+        """Rebuild from (id, location, amenity_mask, price) rows and (apartment_id, count, sum) ratings."""
+        self.__init__()
+        location_codes = {location: code for code, location in enumerate(LOCATIONS)}
+        rows = sorted(rows)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.locations = np.array([location_codes.get(row[1], -1) for row in rows], dtype=np.int16)
+        self.masks = np.array([row[2] for row in rows], dtype=np.int64)
+        self.prices = np.array([row[3] for row in rows], dtype=np.float64)
+
+        self.rating_sums = np.zeros(len(rows), dtype=np.float64)
+        self.rating_counts = np.zeros(len(rows), dtype=np.float64)
+        ratings = [rating for rating in ratings if rating[1]]
+        if ratings:
+            apartment_ids = np.array([rating[0] for rating in ratings], dtype=np.int64)
+            positions = np.searchsorted(self.ids, apartment_ids)
+            known = (positions < len(self.ids)) & (self.ids[np.minimum(positions, len(self.ids) - 1)] == apartment_ids)
+            self.rating_counts[positions[known]] = np.array([rating[1] for rating in ratings], dtype=np.float64)[known]
+            self.rating_sums[positions[known]] = np.array([rating[2] for rating in ratings], dtype=np.float64)[known]
+        self._update_mean_rating()
+        self.built_at = time.monotonic()
+
+    def _update_mean_rating(self):
+        count = self.rating_counts.sum()
+        self.mean_rating = self.rating_sums.sum() / count if count else DEFAULT_RATING
+
+    def _position(self, apartment_id):
+        position = int(np.searchsorted(self.ids, apartment_id))
+        return position, position < len(self.ids) and self.ids[position] == apartment_id
+
+    def set(self, apartment_id, location, amenity_mask, price):
+        """Insert or update an apartment's columns, keeping its ratings."""
+        position, found = self._position(apartment_id)
+        location = LOCATIONS.index(location) if location in LOCATIONS else -1
+        if found:
+            self.locations[position] = location
+            self.masks[position] = amenity_mask
+            self.prices[position] = price
+            return
+        # New apartments usually have the highest id, so this is mostly an append
+        self.ids = np.insert(self.ids, position, apartment_id)
+        self.locations = np.insert(self.locations, position, location)
+        self.masks = np.insert(self.masks, position, amenity_mask)
+        self.prices = np.insert(self.prices, position, price)
+        self.rating_sums = np.insert(self.rating_sums, position, 0.0)
+        self.rating_counts = np.insert(self.rating_counts, position, 0.0)
+
+    def remove(self, apartment_id):
+        position, found = self._position(apartment_id)
+        if not found:
+            return
+        for name in ('ids', 'locations', 'masks', 'prices', 'rating_sums', 'rating_counts'):
+            setattr(self, name, np.delete(getattr(self, name), position))
+        self._update_mean_rating()
+
+    def add_ratings(self, changes):
+        """Apply {apartment_id: (count, rating_sum)} deltas from review writes."""
+        for apartment_id, (count, rating_sum) in changes.items():
+            position, found = self._position(apartment_id)
+            if found:
+                self.rating_counts[position] += count
+                self.rating_sums[position] += rating_sum
+        self._update_mean_rating()
+
+    def is_stale(self, max_age):
+        return max_age is not None and time.monotonic() - self.built_at > max_age
+
+    def match(self, filters, candidates=None):
+        """Boolean array of apartments matching the filters and, if given, in the candidate ids."""
+        matched = np.ones(len(self.ids), dtype=bool)
+        if filters.get('location') and filters['location'] in LOCATIONS:
+            matched &= self.locations == LOCATIONS.index(filters['location'])
+        if filters.get('amenities'):
+            if any(amenity not in AMENITY_BITS for amenity in filters['amenities']):
+                return np.zeros(len(self.ids), dtype=bool)
+            required = _amenity_mask(filters['amenities'])
+            matched &= (self.masks & required) == required
+        if filters.get('min_price') is not None:
+            matched &= self.prices >= filters['min_price']
+        if filters.get('max_price') is not None:
+            matched &= self.prices <= filters['max_price']
+        if candidates is not None:
+            matched &= np.isin(self.ids, candidates)
+        return matched
+
+    def score(self, filters, positions, prior_weight):
+        """Relevance scores for the apartments at positions.
+
+        Sums the share of requested plus preferred amenities present, the
+        Bayesian-average rating scaled to [0, 1], and closeness to the target
+        price.
+        """
+        weights = RANK_WEIGHTS
+        scores = np.zeros(len(positions), dtype=np.float64)
+
+        wanted = _amenity_mask(filters.get('amenities')) | _amenity_mask(filters.get('prefer'))
+        if wanted:
+            present = _count_bits(self.masks[positions], wanted)
+            scores += weights['amenities'] * present / bin(wanted).count('1')
+
+        counts = self.rating_counts[positions]
+        rating = (prior_weight * self.mean_rating + self.rating_sums[positions]) / (prior_weight + counts)
+        scores += weights['rating'] * (rating - 1) / 4
+
+        target = filters.get('target_price')
+        if target:
+            distance = np.abs(self.prices[positions] - target) / target
+            scores += weights['price'] * np.clip(1 - distance, 0, 1)
+        return scores
+
+    def page(self, filters, candidates=None, after=None, before=None, per_page=None, prior_weight=5):
+        """Keyset page of ids ranked by score; returns (ids, next_cursor, prev_cursor).
+
+        Cursors are "score:id" strings in the format of encode_cursor().
+        """
+        per_page = max(1, min(per_page or APARTMENTS_PER_PAGE, MAX_APARTMENTS_PER_PAGE))
+        positions = np.flatnonzero(self.match(filters, candidates))
+        scores = self.score(filters, positions, prior_weight)
+        ids = self.ids[positions]
+
+        backwards = before is not None and after is None
+        cursor = decode_cursor(before if backwards else after, 'rank')
+        if cursor is not None:
+            score, apartment_id = cursor
+            if backwards:
+                keep = (scores > score) | ((scores == score) & (ids < apartment_id))
+            else:
+                keep = (scores < score) | ((scores == score) & (ids > apartment_id))
+            scores, ids = scores[keep], ids[keep]
+
+        # Paging backwards takes the worst entries before the cursor, then flips them
+        if backwards:
+            top = _top(-scores, -ids, per_page + 1)
+        else:
+            top = _top(scores, ids, per_page + 1)
+        has_more = len(top) > per_page
+        top = top[:per_page]
+
+        if not len(top):
+            return [], None, None
+
+        keys = [(float(scores[position]), int(ids[position])) for position in top]
+        if backwards:
+            keys.reverse()
+            next_cursor = encode_cursor(keys[-1], 'rank')
+            prev_cursor = encode_cursor(keys[0], 'rank') if has_more else None
+        else:
+            next_cursor = encode_cursor(keys[-1], 'rank') if has_more else None
+            prev_cursor = encode_cursor(keys[0], 'rank') if cursor is not None else None
+
+        return [key[1] for key in keys], next_cursor, prev_cursor
+
+
+def get_apartment_scores():
+    """The current app's ranking arrays, built from the database on first use."""
+    scores = current_app.extensions.get('apartment_scores')
+    if scores is None or scores.is_stale(current_app.config.get('APARTMENT_INDEX_MAX_AGE')):
+        scores = ApartmentScores()
+        with primary_session():
+            scores.build(
+                db.session.query(Apartment.id, Apartment.location, Apartment.amenity_mask, Apartment.price),
+                db.session.query(Apartment.id, Apartment.review_count, Apartment.rating_sum)
+            )
+        current_app.extensions['apartment_scores'] = scores
+    return scores
+
+
+# Rank matching apartments by relevance; returns (ids, next_cursor, prev_cursor)
+def rank_apartment_page(filters, after=None, before=None, per_page=None):
+    candidates = None
+    if filters.get('q'):
+        query, _ = build_search_query({'q': filters['q']})
+        candidates = np.array([row[0] for row in query.with_entities(Apartment.id)], dtype=np.int64)
+    return get_apartment_scores().page(
+        filters, candidates, after, before, per_page,
+        prior_weight=current_app.config.get('RANKING_PRIOR_WEIGHT', 5)
+    )
+
+
+'''
+Score maintenance
+
+Mirrors the apartment index: flush events record apartment columns and
+review rating deltas on the session, and they are applied to the arrays in
+place once the transaction commits. Review writes also invalidate the cached
+searches ordered by rating; apartment writes already invalidate them all.
+'''
+
+@event.listens_for(Apartment, 'after_insert')
+@event.listens_for(Apartment, 'after_update')
+def queue_apartment_score_update(mapper, connection, target):
+    changes = object_session(target).info.setdefault('apartment_score_changes', {})
+    changes[target.id] = (target.location, target.amenity_mask, target.price)
+
+
+@event.listens_for(Apartment, 'after_delete')
+def queue_apartment_score_delete(mapper, connection, target):
+    changes = object_session(target).info.setdefault('apartment_score_changes', {})
+    changes[target.id] = None
+
+
+def _queue_rating_change(target, apartment_id, count, rating):
+    changes = object_session(target).info.setdefault('apartment_rating_changes', {})
+    total_count, total_sum = changes.get(apartment_id, (0, 0))
+    changes[apartment_id] = (total_count + count, total_sum + count * rating)
+
+
+@event.listens_for(Review, 'after_insert')
+def queue_review_score_insert(mapper, connection, target):
+    _queue_rating_change(target, target.apartment_id, 1, target.rating)
+
+
+@event.listens_for(Review, 'before_delete')
+def queue_review_score_delete(mapper, connection, target):
+    _queue_rating_change(target, stored_value(target, 'apartment_id'), -1, stored_value(target, 'rating'))
+
+
+@event.listens_for(Review, 'after_update')
+def queue_review_score_update(mapper, connection, target):
+    old_apartment_id, old_rating = stored_value(target, 'apartment_id'), stored_value(target, 'rating')
+    if old_apartment_id == target.apartment_id and old_rating == target.rating:
+        return
+    _queue_rating_change(target, old_apartment_id, -1, old_rating)
+    _queue_rating_change(target, target.apartment_id, 1, target.rating)
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_apartment_score_changes(session):
+    changes = session.info.pop('apartment_score_changes', None)
+    ratings = session.info.pop('apartment_rating_changes', None)
+    if ratings:
+        bump_rating_generation()
+    if not (changes or ratings) or not has_app_context():
+        return
+    scores = current_app.extensions.get('apartment_scores')
+    if scores is None:
+        return
+    # Apartments first, so reviews of an apartment created in the same transaction find it
+    for apartment_id, row in (changes or {}).items():
+        if row is None:
+            scores.remove(apartment_id)
+        else:
+            scores.set(apartment_id, *row)
+    if ratings:
+        scores.add_ratings(ratings)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_apartment_score_changes(session):
+    session.info.pop('apartment_score_changes', None)
+    session.info.pop('apartment_rating_changes', None)
@@ -1,15 +1,57 @@
-from App.models import Review, Tenant, Apartment
-from App.database import db
+from App.models import Review, Tenant, Apartment, RatingRollup, RATING_AGGREGATE_COLUMNS, add_to_rating_rollup
+from App.database import db, read_only
+from sqlalchemy import bindparam, case, delete, func, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from collections import Counter
+from datetime import datetime, timedelta
 
-# Create a new review (only verified tenants can leave reviews)
+RECOMPUTE_BATCH_SIZE = 500
+BACKFILL_CHUNK_SIZE = 5000
+
+TIMESERIES_BUCKETS = ('day', 'week', 'month')
+
+REVIEWS_PER_PAGE = 10
+MAX_REVIEWS_PER_PAGE = 100
+
+# Keyset columns for each review order and whether that order is descending
+REVIEW_SORT_ORDERS = {
+    'newest': ((Review.created_at, Review.id), True),
+    'rating_desc': ((Review.rating, Review.id), True),
+    'rating_asc': ((Review.rating, Review.id), False),
+}
+
+# The unique constraint on (tenant_id, apartment_id) that insert_review() relies on
+REVIEW_UNIQUE_CONSTRAINT = 'uq_review_tenant_apartment'
+
+# Whether an IntegrityError came from REVIEW_UNIQUE_CONSTRAINT: Postgres names the
+# constraint in its diagnostics, SQLite only lists the columns in the message
+def is_duplicate_review(error):
+    constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+    if constraint:
+        return constraint == REVIEW_UNIQUE_CONSTRAINT
+    message = str(error.orig)
+    return REVIEW_UNIQUE_CONSTRAINT in message or 'review.tenant_id, review.apartment_id' in message
+
+# Insert a review in a savepoint, letting the (tenant_id, apartment_id) unique constraint
+# reject duplicates instead of probing first. Returns False if the tenant already reviewed it;
+# any other integrity failure is raised.
+def insert_review(review):
+    try:
+        with db.session.begin_nested():
+            db.session.add(review)
+    except IntegrityError as e:
+        if not is_duplicate_review(e):
+            raise
+        return False
+    return True
+
+# Create a new review (only verified tenants can leave reviews, once per apartment)
 def create_review(tenant_id, apartment_id, rating, comment):
     tenant = Tenant.query.get(tenant_id)
-    apartment = Apartment.query.get(apartment_id)
-
-    if not tenant or not apartment:
-        return None
 
-    if tenant.apartment_id != apartment.id:
+    # A tenant's apartment always exists, so this also rejects unknown apartments
+    if not tenant or tenant.apartment_id != apartment_id:
         return None
 
     if not (1 <= rating <= 5):
@@ -21,13 +63,97 @@ def create_review(tenant_id, apartment_id, rating, comment):
         rating=rating,
         comment=comment
     )
-    db.session.add(review)
+    if not insert_review(review):
+        return None
     db.session.commit()
     return review
 
-# Get all reviews for an apartment
-def get_reviews(apartment_id):
-    return [review.get_json() for review in Review.query.filter_by(apartment_id=apartment_id).all()]
+# Create or replace a tenant's review of their apartment; returns (review, created)
+def upsert_review(tenant_id, apartment_id, rating, comment):
+    tenant = Tenant.query.get(tenant_id)
+    if not tenant or tenant.apartment_id != apartment_id or not (1 <= rating <= 5):
+        return None, False
+
+    # Each round inserts or finds the existing review; it only repeats if that review
+    # is deleted between the conflicting insert and the lookup
+    while True:
+        review = Review(tenant_id=tenant_id, apartment_id=apartment_id, rating=rating, comment=comment)
+        if insert_review(review):
+            db.session.commit()
+            return review, True
+
+        review = Review.query.filter_by(tenant_id=tenant_id, apartment_id=apartment_id).one_or_none()
+        if review is not None:
+            review.rating = rating
+            review.comment = comment
+            db.session.commit()
+            return review, False
+
+# Whether a tenant has reviewed an apartment, answered from the unique index
+def has_reviewed(tenant_id, apartment_id):
+    return db.session.query(Review.query.filter_by(tenant_id=tenant_id, apartment_id=apartment_id).exists()).scalar()
+
+# Encode the keyset position of a review as an opaque cursor string
+def encode_review_cursor(key, sort):
+    value = key[0].isoformat() if sort == 'newest' else key[0]
+    return f"{value}:{key[1]}"
+
+# Decode a review cursor back into its key values, or None if it is malformed
+def decode_review_cursor(cursor, sort):
+    if not cursor:
+        return None
+    try:
+        value, review_id = cursor.rsplit(':', 1)
+        value = datetime.fromisoformat(value) if sort == 'newest' else int(value)
+        return (value, int(review_id))
+    except ValueError:
+        return None
+
+# Keyset-paginate an apartment's reviews, authors included; returns (reviews, next_cursor, prev_cursor)
+def paginate_reviews(apartment_id, sort='newest', after=None, before=None, per_page=None):
+    if sort not in REVIEW_SORT_ORDERS:
+        sort = 'newest'
+    columns, descending = REVIEW_SORT_ORDERS[sort]
+    per_page = max(1, min(per_page or REVIEWS_PER_PAGE, MAX_REVIEWS_PER_PAGE))
+
+    backwards = before is not None and after is None
+    cursor = decode_review_cursor(before if backwards else after, sort)
+    scan_descending = descending != backwards
+
+    query = Review.query.options(joinedload(Review.tenant)).filter(Review.apartment_id == apartment_id)
+    if cursor is not None:
+        key, bound = tuple_(*columns), tuple_(*cursor)
+        query = query.filter(key < bound if scan_descending else key > bound)
+    query = query.order_by(*[column.desc() if scan_descending else column.asc() for column in columns])
+    reviews = query.limit(per_page + 1).all()
+    has_more = len(reviews) > per_page
+    reviews = reviews[:per_page]
+
+    if not reviews:
+        return [], None, None
+
+    def key(review):
+        return (getattr(review, columns[0].key), review.id)
+
+    if backwards:
+        reviews.reverse()
+        next_cursor = encode_review_cursor(key(reviews[-1]), sort)
+        prev_cursor = encode_review_cursor(key(reviews[0]), sort) if has_more else None
+    else:
+        next_cursor = encode_review_cursor(key(reviews[-1]), sort) if has_more else None
+        prev_cursor = encode_review_cursor(key(reviews[0]), sort) if cursor is not None else None
+
+    return reviews, next_cursor, prev_cursor
+
+# One page of an apartment's reviews as JSON, for the API
+@read_only
+def get_review_page(apartment_id, sort='newest', after=None, before=None, per_page=None):
+    reviews, next_cursor, prev_cursor = paginate_reviews(apartment_id, sort, after, before, per_page)
+    return {
+        "reviews": [dict(review.get_json(), tenant=review.tenant.username) for review in reviews],
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    }
 
 # Update a review
 def update_review(id, data):
@@ -52,4 +178,113 @@ def delete_review(id):
 
     db.session.delete(review)
     db.session.commit()
-    return True
\ No newline at end of file
+    return True
+
+# Recompute the rating aggregates of every apartment from its reviews, committing
+# one batch of apartments at a time. Drifted rows are fixed with a core UPDATE, like
+# the review hooks, so the repair neither bumps apartment versions nor reaches the
+# search and ranking hooks. Returns the number of apartments corrected.
+def recompute_rating_aggregates(batch_size=RECOMPUTE_BATCH_SIZE):
+    apartment = Apartment.__table__
+    columns = [func.count(Review.id), func.coalesce(func.sum(Review.rating), 0)]
+    columns += [func.coalesce(func.sum(case((Review.rating == rating, 1), else_=0)), 0) for rating in range(1, 6)]
+    repair = (update(apartment)
+              .where(apartment.c.id == bindparam('apartment_id'))
+              .values({apartment.c[name]: bindparam(f'new_{name}') for name in RATING_AGGREGATE_COLUMNS}))
+
+    repaired, last_id = 0, 0
+    while True:
+        stored = db.session.execute(
+            select(apartment.c.id, *[apartment.c[name] for name in RATING_AGGREGATE_COLUMNS])
+            .where(apartment.c.id > last_id).order_by(apartment.c.id).limit(batch_size)
+        ).all()
+        if not stored:
+            return repaired
+        last_id = stored[-1][0]
+
+        actual = {
+            row[0]: list(row[1:])
+            for row in db.session.query(Review.apartment_id, *columns)
+                .filter(Review.apartment_id.in_([row[0] for row in stored]))
+                .group_by(Review.apartment_id)
+        }
+        fixes = []
+        for apartment_id, *values in stored:
+            expected = actual.get(apartment_id, [0] * len(RATING_AGGREGATE_COLUMNS))
+            if values != expected:
+                fixes.append(dict(apartment_id=apartment_id, **{
+                    f'new_{name}': value for name, value in zip(RATING_AGGREGATE_COLUMNS, expected)
+                }))
+        if fixes:
+            db.session.connection().execute(repair, fixes)
+            repaired += len(fixes)
+        db.session.commit()
+
+# Rebuild the daily rating rollups by streaming the reviews in id order, one chunk
+# at a time, in a single transaction: readers keep seeing the old rollups until it
+# commits, and a failure leaves them untouched. On Postgres the rollup table is
+# locked against writes, so a review written meanwhile waits and then applies its
+# own change on top of the rebuilt rows instead of being lost or counted twice;
+# SQLite already serializes writers. Returns the number of reviews rolled up.
+def backfill_rating_rollups(chunk_size=BACKFILL_CHUNK_SIZE):
+    try:
+        connection = db.session.connection()
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('LOCK TABLE rating_rollup IN EXCLUSIVE MODE'))
+        connection.execute(delete(RatingRollup.__table__))
+
+        streamed, last_id = 0, 0
+        while True:
+            rows = (db.session.query(Review.id, Review.apartment_id, Review.created_at, Review.rating)
+                    .filter(Review.id > last_id)
+                    .order_by(Review.id).limit(chunk_size).all())
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            counts, sums = Counter(), Counter()
+            for row in rows:
+                key = (row.apartment_id, row.created_at.date())
+                counts[key] += 1
+                sums[key] += row.rating
+            for (apartment_id, day), count in counts.items():
+                add_to_rating_rollup(connection, apartment_id, day, count, sums[(apartment_id, day)])
+            streamed += len(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return streamed
+
+def _bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+# An apartment's review count and average rating per day, week (from Monday) or month
+# between two dates inclusive, re-bucketed from the daily rollups
+def get_rating_timeseries(apartment_id, start=None, end=None, bucket='week'):
+    if bucket not in TIMESERIES_BUCKETS:
+        bucket = 'week'
+    query = RatingRollup.query.filter(RatingRollup.apartment_id == apartment_id, RatingRollup.count > 0)
+    if start is not None:
+        query = query.filter(RatingRollup.day >= start)
+    if end is not None:
+        query = query.filter(RatingRollup.day <= end)
+
+    series = {}
+    for rollup in query.order_by(RatingRollup.day):
+        point = series.setdefault(_bucket_start(rollup.day, bucket), [0, 0])
+        point[0] += rollup.count
+        point[1] += rollup.rating_sum
+    return [
+        {
+            "start": day.isoformat(),
+            "count": count,
+            "rating_sum": rating_sum,
+            "average_rating": rating_sum / count
+        }
+        for day, (count, rating_sum) in series.items()
+    ]
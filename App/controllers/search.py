@@ -0,0 +1,497 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+import time
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from App.models import Apartment
+from App.database import db, primary_session, read_only
+from App.constants import AMENITY_BITS, LOCATIONS, PRICE_BUCKETS
+from App.controllers.apartment import (
+    APARTMENTS_PER_PAGE,
+    MAX_APARTMENTS_PER_PAGE,
+    SORT_ORDERS,
+    build_search_query,
+    count_search_facets,
+    decode_cursor,
+    encode_cursor,
+    format_facets,
+    paginate_apartments
+)
+from App.controllers.geo import apartments_near
+from App.controllers.ranking import rank_apartment_page
+from App.controllers.search_cache import bump_catalog_generation, filters_key, get_search_cache, normalize_filters
+
+# Width of the price blocks whose bitmaps make price range filters cheap
+PRICE_BLOCK = 100
+
+# Price-ordered scans walk at most this many entries per candidate before sorting the candidates
+WALK_FACTOR = 4
+
+# Listing orders the index can answer; anything else goes to SQL
+INDEX_SORTS = ('newest', 'price_asc', 'price_desc')
+
+# Listing orders that depend on reviews, whose cached pages review writes invalidate
+RATED_SORTS = ('rank', 'rating')
+
+# Largest number of ids sent in a single IN (...) clause
+ID_CHUNK_SIZE = 500
+
+
+def _bitmap(ids):
+    bits = bytearray(max(ids, default=0) // 8 + 1)
+    for apartment_id in ids:
+        bits[apartment_id >> 3] |= 1 << (apartment_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _popcount(bitmap):
+    if hasattr(bitmap, 'bit_count'):
+        return bitmap.bit_count()
+    return bin(bitmap).count('1')
+
+
+def _price_bucket(price):
+    return max(bisect_right(PRICE_BUCKETS, price) - 1, 0)
+
+
+def _iter_bits(bitmap, descending=False):
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    positions = range(len(data) - 1, -1, -1) if descending else range(len(data))
+    offsets = range(7, -1, -1) if descending else range(8)
+    for position in positions:
+        byte = data[position]
+        if byte:
+            for offset in offsets:
+                if byte >> offset & 1:
+                    yield position * 8 + offset
+
+
+class ApartmentIndex:
+    """Process-local inverted index over the apartment catalog.
+
+    Each location and amenity maps to a bitmap of apartment ids (a Python int
+    with bit n set for apartment n), so filter combinations are answered with
+    bitwise ANDs. Prices live in a (price, id) sorted list for range scans and
+    price ordering.
+    """
+
+    def __init__(self):
+        self.built_at = None
+        self._all = 0
+        self._by_location = {}
+        self._by_amenity = {amenity: 0 for amenity in AMENITY_BITS}
+        self._by_price = []
+        self._by_price_bucket = [0] * len(PRICE_BUCKETS)
+        self._by_price_block = {}
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def build(self, rows):
+        """Rebuild from (id, location, amenity_mask, price) rows."""
+        self.__init__()
+        by_location = {}
+        by_amenity = {amenity: [] for amenity in AMENITY_BITS}
+        by_price_bucket = [[] for _ in PRICE_BUCKETS]
+        by_price_block = {}
+        for apartment_id, location, amenity_mask, price in rows:
+            by_location.setdefault(location, []).append(apartment_id)
+            by_price_bucket[_price_bucket(price)].append(apartment_id)
+            by_price_block.setdefault(int(price // PRICE_BLOCK), []).append(apartment_id)
+            for amenity, bit in AMENITY_BITS.items():
+                if amenity_mask & bit:
+                    by_amenity[amenity].append(apartment_id)
+            self._by_price.append((price, apartment_id))
+            self._rows[apartment_id] = (location, amenity_mask, price)
+
+        self._all = _bitmap(self._rows)
+        self._by_location = {location: _bitmap(ids) for location, ids in by_location.items()}
+        self._by_amenity = {amenity: _bitmap(ids) for amenity, ids in by_amenity.items()}
+        self._by_price_bucket = [_bitmap(ids) for ids in by_price_bucket]
+        self._by_price_block = {block: _bitmap(ids) for block, ids in by_price_block.items()}
+        self._by_price.sort()
+        self.built_at = time.monotonic()
+
+    def is_stale(self, max_age):
+        return max_age is not None and time.monotonic() - self.built_at > max_age
+
+    def add(self, apartment_id, location, amenity_mask, price):
+        """Insert or replace a single apartment."""
+        self.remove(apartment_id)
+        bit = 1 << apartment_id
+        self._all |= bit
+        self._by_location[location] = self._by_location.get(location, 0) | bit
+        for amenity, amenity_bit in AMENITY_BITS.items():
+            if amenity_mask & amenity_bit:
+                self._by_amenity[amenity] |= bit
+        insort(self._by_price, (price, apartment_id))
+        self._by_price_bucket[_price_bucket(price)] |= bit
+        block = int(price // PRICE_BLOCK)
+        self._by_price_block[block] = self._by_price_block.get(block, 0) | bit
+        self._rows[apartment_id] = (location, amenity_mask, price)
+
+    def remove(self, apartment_id):
+        row = self._rows.pop(apartment_id, None)
+        if row is None:
+            return
+        location, amenity_mask, price = row
+        bit = 1 << apartment_id
+        self._all &= ~bit
+        self._by_location[location] &= ~bit
+        for amenity, amenity_bit in AMENITY_BITS.items():
+            if amenity_mask & amenity_bit:
+                self._by_amenity[amenity] &= ~bit
+        del self._by_price[bisect_left(self._by_price, (price, apartment_id))]
+        self._by_price_bucket[_price_bucket(price)] &= ~bit
+        self._by_price_block[int(price // PRICE_BLOCK)] &= ~bit
+
+    def match(self, filters):
+        """Bitmap of apartments matching the location and amenity filters."""
+        bitmap = self._all
+        if filters.get('location') and filters['location'] in LOCATIONS:
+            bitmap &= self._by_location.get(filters['location'], 0)
+        for amenity in filters.get('amenities') or []:
+            if amenity not in self._by_amenity:
+                return 0
+            bitmap &= self._by_amenity[amenity]
+        return bitmap
+
+    def _price_range_bitmap(self, min_price, max_price):
+        if min_price is None and max_price is None:
+            return self._all
+        by_price = self._by_price
+        start = bisect_left(by_price, (min_price, -1)) if min_price is not None else 0
+        end = bisect_right(by_price, (max_price, float('inf'))) if max_price is not None else len(by_price)
+        if start >= end:
+            return 0
+
+        # Whole price blocks inside the range are ORed; only the two edge blocks are scanned
+        low_block = int(by_price[start][0] // PRICE_BLOCK)
+        high_block = int(by_price[end - 1][0] // PRICE_BLOCK)
+        if low_block == high_block:
+            return _bitmap([apartment_id for _, apartment_id in by_price[start:end]])
+        bitmap = 0
+        for block, block_bitmap in self._by_price_block.items():
+            if low_block < block < high_block:
+                bitmap |= block_bitmap
+        low_end = bisect_left(by_price, ((low_block + 1) * PRICE_BLOCK, -1))
+        high_start = bisect_left(by_price, (high_block * PRICE_BLOCK, -1))
+        edges = by_price[start:low_end] + by_price[high_start:end]
+        return bitmap | _bitmap([apartment_id for _, apartment_id in edges])
+
+    def facets(self, filters):
+        """Facet counts for a filter set; each facet ignores its own filter."""
+        amenity_bitmap = self.match({'amenities': filters.get('amenities')})
+        location_bitmap = self._all
+        if filters.get('location') and filters['location'] in LOCATIONS:
+            location_bitmap = self._by_location.get(filters['location'], 0)
+        price_bitmap = self._price_range_bitmap(filters.get('min_price'), filters.get('max_price'))
+
+        for_locations = amenity_bitmap & price_bitmap
+        matching = for_locations & location_bitmap
+        for_prices = amenity_bitmap & location_bitmap
+        return format_facets(
+            _popcount(matching),
+            [_popcount(for_locations & self._by_location.get(location, 0)) for location in LOCATIONS],
+            [_popcount(matching & self._by_amenity[amenity]) for amenity in AMENITY_BITS],
+            [_popcount(for_prices & bucket) for bucket in self._by_price_bucket]
+        )
+
+    def _in_price_range(self, apartment_id, min_price, max_price):
+        price = self._rows[apartment_id][2]
+        return (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+
+    def search(self, filters):
+        """Ids of every matching apartment, in ascending id order."""
+        min_price, max_price = filters.get('min_price'), filters.get('max_price')
+        return [apartment_id for apartment_id in _iter_bits(self.match(filters))
+                if self._in_price_range(apartment_id, min_price, max_price)]
+
+    def filter(self, filters, ids):
+        """The given ids that match the filters, in the order given."""
+        bitmap = self.match(filters)
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+        min_price, max_price = filters.get('min_price'), filters.get('max_price')
+        return [apartment_id for apartment_id in ids
+                if apartment_id >> 3 < len(data) and data[apartment_id >> 3] >> (apartment_id & 7) & 1
+                and self._in_price_range(apartment_id, min_price, max_price)]
+
+    def _scan_by_id(self, bitmap, cursor, descending, min_price, max_price):
+        if cursor is not None:
+            # Clamp so a hostile cursor cannot allocate an enormous mask
+            boundary = min(max(cursor[0], -1), bitmap.bit_length())
+            if descending:
+                bitmap &= (1 << max(boundary, 0)) - 1
+            else:
+                bitmap = bitmap >> (boundary + 1) << (boundary + 1)
+        for apartment_id in _iter_bits(bitmap, descending):
+            if self._in_price_range(apartment_id, min_price, max_price):
+                yield (apartment_id,)
+
+    def _scan_by_price(self, bitmap, cursor, descending, min_price, max_price):
+        by_price = self._by_price
+        start = bisect_left(by_price, (min_price, -1)) if min_price is not None else 0
+        end = bisect_right(by_price, (max_price, float('inf'))) if max_price is not None else len(by_price)
+        if cursor is not None:
+            if descending:
+                end = min(end, bisect_left(by_price, cursor))
+            else:
+                start = max(start, bisect_right(by_price, cursor))
+        if start >= end:
+            return
+
+        positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+        if bitmap == self._all:
+            for position in positions:
+                yield by_price[position]
+            return
+
+        # Walk the price range testing membership against the bitmap bytes; if the
+        # matches turn out sparse, stop and sort the remaining candidates instead
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+        budget = _popcount(bitmap) * WALK_FACTOR
+        for steps, position in enumerate(positions):
+            if steps == budget:
+                remaining = by_price[start:position + 1] if descending else by_price[position:end]
+                lower, upper = remaining[0], remaining[-1]
+                keys = [(self._rows[apartment_id][2], apartment_id) for apartment_id in _iter_bits(bitmap)]
+                keys = sorted(key for key in keys if lower <= key <= upper)
+                yield from reversed(keys) if descending else keys
+                return
+            price, apartment_id = by_price[position]
+            byte = apartment_id >> 3
+            if byte < len(data) and data[byte] >> (apartment_id & 7) & 1:
+                yield (price, apartment_id)
+
+    def page(self, filters, sort='newest', after=None, before=None, per_page=None):
+        """Keyset page of matching ids; returns (ids, next_cursor, prev_cursor).
+
+        Cursors are interchangeable with paginate_apartments().
+        """
+        if sort not in INDEX_SORTS:
+            sort = 'newest'
+        per_page = max(1, min(per_page or APARTMENTS_PER_PAGE, MAX_APARTMENTS_PER_PAGE))
+        descending = SORT_ORDERS[sort][1]
+
+        backwards = before is not None and after is None
+        cursor = decode_cursor(before if backwards else after, sort)
+        scan = self._scan_by_id if sort == 'newest' else self._scan_by_price
+        keys = list(islice(
+            scan(self.match(filters), cursor, descending != backwards, filters.get('min_price'), filters.get('max_price')),
+            per_page + 1
+        ))
+        has_more = len(keys) > per_page
+        keys = keys[:per_page]
+
+        if not keys:
+            return [], None, None
+
+        if backwards:
+            keys.reverse()
+            next_cursor = encode_cursor(keys[-1], sort)
+            prev_cursor = encode_cursor(keys[0], sort) if has_more else None
+        else:
+            next_cursor = encode_cursor(keys[-1], sort) if has_more else None
+            prev_cursor = encode_cursor(keys[0], sort) if cursor is not None else None
+
+        return [key[-1] for key in keys], next_cursor, prev_cursor
+
+
+def get_apartment_index():
+    """The current app's index, built from the database on first use."""
+    index = current_app.extensions.get('apartment_index')
+    if index is None or index.is_stale(current_app.config.get('APARTMENT_INDEX_MAX_AGE')):
+        index = ApartmentIndex()
+        with primary_session():
+            index.build(db.session.query(Apartment.id, Apartment.location, Apartment.amenity_mask, Apartment.price))
+        current_app.extensions['apartment_index'] = index
+    return index
+
+
+def reset_apartment_snapshots():
+    """Drop the current app's index, grid and ranking arrays and every cached search.
+
+    For bulk writes that bypass the ORM hooks; the snapshots are rebuilt
+    from the database on next use.
+    """
+    bump_catalog_generation()
+    for name in ('apartment_index', 'apartment_grid', 'apartment_scores'):
+        current_app.extensions.pop(name, None)
+
+
+# Load apartments by id, preserving the order of the ids given
+def get_apartments_by_ids(ids):
+    apartments = {}
+    for position in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[position:position + ID_CHUNK_SIZE]
+        for apartment in Apartment.query.filter(Apartment.id.in_(chunk)):
+            apartments[apartment.id] = apartment
+    return [apartments[apartment_id] for apartment_id in ids if apartment_id in apartments]
+
+
+# Keyword searches always go to the database's full-text index
+def use_apartment_index(filters):
+    return current_app.config.get('APARTMENT_INDEX_ENABLED', False) and not filters.get('q')
+
+
+# The given ids that match the filters, in the order given
+def filter_apartment_ids(filters, ids):
+    if use_apartment_index(filters):
+        return get_apartment_index().filter(filters, ids)
+    query, _ = build_search_query(filters)
+    matching = set()
+    for position in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[position:position + ID_CHUNK_SIZE]
+        matching.update(row[0] for row in query.filter(Apartment.id.in_(chunk)).with_entities(Apartment.id))
+    return [apartment_id for apartment_id in ids if apartment_id in matching]
+
+
+# (distance_km, id) of the apartments matching a near= search, nearest first
+def near_matches(filters):
+    nearby = apartments_near(filters)
+    matching = set(filter_apartment_ids(filters, [apartment_id for _, apartment_id in nearby]))
+    return [key for key in nearby if key[1] in matching]
+
+
+# Keyset page over an already sorted list of (sort value, id) keys
+def page_sorted_keys(keys, sort, after=None, before=None, per_page=None):
+    per_page = max(1, min(per_page or APARTMENTS_PER_PAGE, MAX_APARTMENTS_PER_PAGE))
+    backwards = before is not None and after is None
+    cursor = decode_cursor(before if backwards else after, sort)
+    if cursor is None:
+        start, end = 0, per_page
+    elif backwards:
+        end = bisect_left(keys, cursor)
+        start = max(end - per_page, 0)
+    else:
+        start = bisect_right(keys, cursor)
+        end = start + per_page
+    page = keys[start:end]
+
+    if not page:
+        return [], None, None
+    next_cursor = encode_cursor(page[-1], sort) if end < len(keys) else None
+    prev_cursor = encode_cursor(page[0], sort) if start > 0 else None
+    return [key[1] for key in page], next_cursor, prev_cursor
+
+
+# Look key up in the search cache, computing and storing (ids, extra) on a miss; rated
+# results are ordered by rating and go stale on review writes too.
+# The outcome is left on flask.g for the X-Search-Cache response header.
+def cached_search(key, compute, use_cache=True, rated=False):
+    cache = get_search_cache() if use_cache else None
+    if cache is None:
+        status, result = 'bypass', compute()
+    else:
+        result = cache.get(key)
+        status = 'hit' if result is not None else 'miss'
+        if result is None:
+            # The cache outlives this request, so fill it from the primary
+            with primary_session():
+                result = compute()
+            cache.put(key, *result, rated=rated)
+    if has_request_context():
+        g.search_cache_status = status
+    return result
+
+
+@read_only
+def search_apartments(filters, use_cache=True):
+    filters = normalize_filters(filters)
+
+    def compute():
+        if filters['near']:
+            return [apartment_id for _, apartment_id in near_matches(filters)], None
+        if use_apartment_index(filters):
+            return get_apartment_index().search(filters), None
+        query, rank = build_search_query(filters)
+        if rank is not None:
+            query = query.order_by(rank)
+        return [apartment_id for apartment_id, in query.order_by(Apartment.id).with_entities(Apartment.id)], None
+
+    ids, _ = cached_search(('all', filters_key(filters)), compute, use_cache)
+    return get_apartments_by_ids(ids)
+
+
+@read_only
+def search_facets(filters):
+    if use_apartment_index(filters):
+        return get_apartment_index().facets(filters)
+    return count_search_facets(filters)
+
+
+# One page of search results; returns (apartments, next_cursor, prev_cursor).
+# sort='rank' orders by relevance score (see App.controllers.ranking); near= searches
+# are always ordered by distance.
+@read_only
+def search_apartment_page(filters, sort=None, after=None, before=None, per_page=None, use_cache=True):
+    filters = normalize_filters(filters)
+
+    def compute():
+        if filters['near']:
+            ids, next_cursor, prev_cursor = page_sorted_keys(near_matches(filters), 'distance', after, before, per_page)
+            return ids, (next_cursor, prev_cursor)
+        if sort == 'rank':
+            ids, next_cursor, prev_cursor = rank_apartment_page(filters, after, before, per_page)
+            return ids, (next_cursor, prev_cursor)
+        if use_apartment_index(filters) and (sort or 'newest') in INDEX_SORTS:
+            ids, next_cursor, prev_cursor = get_apartment_index().page(filters, sort, after, before, per_page)
+            return ids, (next_cursor, prev_cursor)
+        query, rank = build_search_query(filters)
+        ids, next_cursor, prev_cursor = paginate_apartments(
+            query.with_entities(Apartment.id), sort, after, before, per_page, rank=rank
+        )
+        return ids, (next_cursor, prev_cursor)
+
+    key = ('page', filters_key(filters), sort, after, before, per_page)
+    rated = sort in RATED_SORTS and not filters['near']
+    ids, (next_cursor, prev_cursor) = cached_search(key, compute, use_cache, rated)
+    return get_apartments_by_ids(ids), next_cursor, prev_cursor
+
+
+'''
+Index maintenance
+
+Flush events record each apartment's new state on the session, and the
+changes are applied to the index only once the transaction commits.
+'''
+
+@event.listens_for(Apartment, 'after_insert')
+@event.listens_for(Apartment, 'after_update')
+def queue_apartment_index_update(mapper, connection, target):
+    changes = object_session(target).info.setdefault('apartment_index_changes', {})
+    changes[target.id] = (target.location, target.amenity_mask, target.price)
+
+
+@event.listens_for(Apartment, 'after_delete')
+def queue_apartment_index_delete(mapper, connection, target):
+    changes = object_session(target).info.setdefault('apartment_index_changes', {})
+    changes[target.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_apartment_index_changes(session):
+    changes = session.info.pop('apartment_index_changes', None)
+    if not changes:
+        return
+    # Any apartment write invalidates every cached search result
+    bump_catalog_generation()
+    if not has_app_context():
+        return
+    index = current_app.extensions.get('apartment_index')
+    if index is None:
+        return
+    for apartment_id, row in changes.items():
+        if row is None:
+            index.remove(apartment_id)
+        else:
+            index.add(apartment_id, *row)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_apartment_index_changes(session):
+    session.info.pop('apartment_index_changes', None)
@@ -0,0 +1,138 @@
+from array import array
+from collections import OrderedDict
+import sys
+import time
+
+from flask import current_app
+
+from App.constants import LOCATIONS
+
+# Rough per-entry bookkeeping cost on top of the stored ids and key
+ENTRY_OVERHEAD = 256
+
+# Bumped after every commit that writes an Apartment; entries from older generations are discarded
+catalog_generation = 0
+
+# Bumped after every commit that writes a Review; only discards entries ordered by rating
+rating_generation = 0
+
+
+def bump_catalog_generation():
+    global catalog_generation
+    catalog_generation += 1
+
+
+def bump_rating_generation():
+    global rating_generation
+    rating_generation += 1
+
+
+def normalize_filters(filters):
+    """Canonical form of a search filter dict, so equivalent searches share a cache key."""
+    location = filters.get('location')
+    return {
+        'q': ' '.join((filters.get('q') or '').lower().split()),
+        'location': location if location in LOCATIONS else None,
+        'amenities': sorted(set(filters.get('amenities') or [])),
+        'min_price': round(filters['min_price'], 2) if filters.get('min_price') is not None else None,
+        'max_price': round(filters['max_price'], 2) if filters.get('max_price') is not None else None,
+        'prefer': sorted(set(filters.get('prefer') or [])),
+        'target_price': round(filters['target_price'], 2) if filters.get('target_price') else None,
+        'near': filters.get('near') if filters.get('near') in LOCATIONS else None,
+        'radius_km': round(filters['radius_km'], 2) if filters.get('radius_km') else None,
+    }
+
+
+def filters_key(filters):
+    """Hashable key for filters already passed through normalize_filters()."""
+    return (
+        filters['q'], filters['location'], tuple(filters['amenities']), filters['min_price'], filters['max_price'],
+        tuple(filters['prefer']), filters['target_price'], filters['near'], filters['radius_km']
+    )
+
+
+class SearchCache:
+    """LRU cache of search results stored as apartment id arrays.
+
+    Entries are stamped with the catalog generation they were computed at and
+    are treated as misses once any apartment has been written since, or once
+    they are older than max_age seconds (which bounds staleness from writes
+    made by other workers). Entries put with rated=True, whose order depends
+    on ratings, are also stamped with the rating generation and go stale
+    once any review has been written.
+    """
+
+    def __init__(self, max_bytes, max_age=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached (ids, extra) for key, or None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            generation, ratings, created_at, size, ids, extra = entry
+            expired = self.max_age is not None and time.monotonic() - created_at > self.max_age
+            current = generation == catalog_generation and ratings in (None, rating_generation)
+            if current and not expired:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(ids), extra
+            self._discard(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, ids, extra=None, rated=False):
+        ids = array('q', ids)
+        size = sys.getsizeof(ids) + len(repr(key)) + len(repr(extra)) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self._discard(key)
+        ratings = rating_generation if rated else None
+        self._entries[key] = (catalog_generation, ratings, time.monotonic(), size, ids, extra)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[3]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'generation': catalog_generation,
+            'rating_generation': rating_generation,
+        }
+
+
+def get_search_cache():
+    """The current app's search cache, or None when caching is disabled."""
+    if not current_app.config.get('SEARCH_CACHE_ENABLED', False):
+        return None
+    cache = current_app.extensions.get('search_cache')
+    if cache is None:
+        cache = SearchCache(
+            current_app.config.get('SEARCH_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+            current_app.config.get('SEARCH_CACHE_MAX_AGE')
+        )
+        current_app.extensions['search_cache'] = cache
+    return cache
@@ -1,10 +1,11 @@
 from App.database import db
 from App.models import Tenant
 from App.models import Apartment
+from App.controllers.apartment import get_apartment_via_leasecode
 from werkzeug.security import check_password_hash, generate_password_hash
 
 def create_tenant(username, email, password, lease_code):
-    apartment = Apartment.query.filter_by(lease_code=lease_code).first()
+    apartment = get_apartment_via_leasecode(lease_code)
     if not apartment:
         return None
 
@@ -12,7 +13,7 @@ def create_tenant(username, email, password, lease_code):
         username=username,
         email=email,
         password=password,
-        lease_code=apartment.lease_code
+        lease_code=lease_code
     )
     db.session.add(tenant)
     db.session.commit()
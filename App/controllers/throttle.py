@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from flask import current_app
+
+'''
+Login throttling
+
+Every login attempt costs a password-hash verification, so attempts are
+metered by token buckets, one per username and one per client IP, before any
+hashing happens. Buckets live in a small SQLite file that every worker on the
+node opens, so the limits hold across gunicorn workers without an external
+service. Each check is one short BEGIN IMMEDIATE transaction.
+'''
+
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), 'rentradar-login-throttle.sqlite')
+
+# Buckets that have refilled completely carry no state and are pruned this often (in checks)
+PRUNE_EVERY = 1000
+
+METRICS = ('allowed', 'throttled_username', 'throttled_ip')
+
+
+class LoginThrottle:
+    """Token buckets for login attempts in a SQLite file shared by all workers."""
+
+    def __init__(self, path, user_burst, user_per_minute, ip_burst, ip_per_minute):
+        self.path = path
+        self.limits = {
+            'username': (user_burst, user_per_minute / 60.0),
+            'ip': (ip_burst, ip_per_minute / 60.0),
+        }
+        self._lock = threading.Lock()
+        self._checks = 0
+        self._connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE TABLE IF NOT EXISTS metric (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def _level(self, key, kind, now):
+        capacity, rate = self.limits[kind]
+        row = self._connection.execute('SELECT tokens, updated_at FROM bucket WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + (now - row[1]) * rate)
+
+    def attempt(self, username, ip):
+        """Spend one token from both buckets; returns None if allowed, else seconds until retrying can succeed."""
+        keys = {'username': f'username:{(username or "").lower()}', 'ip': f'ip:{ip}'}
+        now = time.time()
+        with self._lock:
+            connection = self._connection
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                levels = {kind: self._level(key, kind, now) for kind, key in keys.items()}
+                short = {kind: level for kind, level in levels.items() if level < 1}
+                if short:
+                    # Throttled attempts spend nothing, so waiting out retry_after is enough
+                    retry_after = max((1 - level) / self.limits[kind][1] for kind, level in short.items())
+                    metric = 'throttled_username' if 'username' in short else 'throttled_ip'
+                else:
+                    retry_after, metric = None, 'allowed'
+                    connection.executemany(
+                        'INSERT OR REPLACE INTO bucket (key, tokens, updated_at) VALUES (?, ?, ?)',
+                        [(keys[kind], level - 1, now) for kind, level in levels.items()]
+                    )
+                connection.execute(
+                    'INSERT INTO metric (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1',
+                    (metric,)
+                )
+                self._checks += 1
+                if self._checks % PRUNE_EVERY == 0:
+                    self._prune(now)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return retry_after
+
+    def _prune(self, now):
+        # A bucket is full again once it has gone capacity / rate seconds untouched
+        longest = max(capacity / rate for capacity, rate in self.limits.values())
+        self._connection.execute('DELETE FROM bucket WHERE updated_at < ?', (now - longest,))
+
+    def reset(self, username=None, ip=None):
+        """Forget the buckets for a username and/or IP, e.g. after a password reset."""
+        with self._lock:
+            for key in ([f'username:{username.lower()}'] if username else []) + ([f'ip:{ip}'] if ip else []):
+                self._connection.execute('DELETE FROM bucket WHERE key = ?', (key,))
+
+    def stats(self):
+        """Node-wide counters, summed over every worker sharing the store."""
+        with self._lock:
+            counts = dict(self._connection.execute('SELECT name, value FROM metric'))
+            buckets = self._connection.execute('SELECT count(*) FROM bucket').fetchone()[0]
+        stats = {name: counts.get(name, 0) for name in METRICS}
+        stats['buckets'] = buckets
+        return stats
+
+
+def get_login_throttle():
+    """The current app's login throttle, or None when LOGIN_THROTTLE_ENABLED is off."""
+    config = current_app.config
+    if not config.get('LOGIN_THROTTLE_ENABLED', False):
+        return None
+    throttle = current_app.extensions.get('login_throttle')
+    if throttle is None:
+        throttle = LoginThrottle(
+            config.get('LOGIN_THROTTLE_STORE') or DEFAULT_STORE_PATH,
+            config['LOGIN_THROTTLE_USER_BURST'], config['LOGIN_THROTTLE_USER_PER_MINUTE'],
+            config['LOGIN_THROTTLE_IP_BURST'], config['LOGIN_THROTTLE_IP_PER_MINUTE']
+        )
+        current_app.extensions['login_throttle'] = throttle
+    return throttle
+
+
+def throttle_login(username, ip):
+    """Seconds the client must wait before this login attempt may proceed, or None to go ahead."""
+    throttle = get_login_throttle()
+    return throttle.attempt(username, ip) if throttle is not None else None
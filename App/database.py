@@ -1,14 +1,248 @@
+from contextlib import contextmanager
+from functools import partial, wraps
+import logging
+import random
+import time
+
+from flask import current_app, g, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_migrate import Migrate
+from sqlalchemy import Select, create_engine, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from App.config import replica_engine_options
+
+
+'''
+Read routing
+
+Each app opens an engine per DATABASE_REPLICA_URLS entry. GET and HEAD
+requests, and controllers marked @read_only, run with the session in
+read-only mode: SELECTs go to a replica, and autoflush and
+expire_on_commit are off since nothing is written. Writes mark the session,
+which then reads from the primary; a request that wrote also sets a cookie
+keeping that client's reads on the primary for
+DATABASE_READ_YOUR_WRITES_SECONDS, long enough for the replicas to catch up.
+Snapshots shared by the whole worker, such as the apartment index, are
+built inside primary_session() so a lagging replica never seeds them.
+'''
+
+# Holds the time until which a client that just wrote reads from the primary
+READ_YOUR_WRITES_COOKIE = 'read_primary_until'
+
+
+class RoutingSession(Session):
+    """Sends the SELECTs of a read-only session to a read replica, and everything else to the primary.
+
+    Each session sticks to one replica. Once it has flushed, it reads from
+    the primary for the rest of its life so it always sees its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if (bind is None and self.info.get('read_only') and not self.info.get('wrote') and not self.info.get('primary')
+                and not self._flushing and isinstance(clause, Select)):
+            replicas = replica_engines()
+            if replicas and engine is self._db.engines.get(None):
+                if self.info.get('replica') not in replicas:
+                    self.info['replica'] = random.choice(list(replicas))
+                return replicas[self.info['replica']]
+        return engine
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+logger = logging.getLogger(__name__)
 
 def get_migrate(app):
-    return Migrate(app, db)
+    # SQLite cannot ALTER most constraints in place, so migrations use batch mode
+    return Migrate(app, db, render_as_batch=True)
+
+# Config keys of the PRAGMAs setup_engines() runs on every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'SQLITE_JOURNAL_MODE',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'cache_size': 'SQLITE_CACHE_SIZE',
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT',
+}
+
+def _apply_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas:
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+def replica_engines():
+    """The current app's read replica engines, keyed replica_0, replica_1 and so on."""
+    return current_app.extensions.get('read_replicas', {})
+
+def _all_engines():
+    return {**db.engines, **replica_engines()}
+
+def setup_engines(app):
+    """Tune the app's SQLite engines with the configured PRAGMAs; call after db.init_app() and setup_read_routing()."""
+    pragmas = [(name, app.config[key]) for name, key in SQLITE_PRAGMAS.items() if app.config.get(key) not in (None, '')]
+    with app.app_context():
+        for engine in _all_engines().values():
+            if engine.dialect.name == 'sqlite' and pragmas:
+                event.listen(engine, 'connect', partial(_apply_sqlite_pragmas, pragmas))
+
+def dispose_engines(app):
+    """Forget pooled connections inherited from a parent process, without closing the parent's."""
+    with app.app_context():
+        for engine in _all_engines().values():
+            engine.dispose(close=False)
+
+def pool_stats():
+    """Connection pool usage of each of the current app's engines, keyed by bind (None is the default)."""
+    stats = {}
+    for bind, engine in _all_engines().items():
+        pool = engine.pool
+        entry = {'dialect': engine.dialect.name, 'pool': type(pool).__name__, 'status': pool.status()}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                         overflow=pool.overflow())
+        stats[bind or 'default'] = entry
+    return stats
+
+@event.listens_for(RoutingSession, 'after_flush')
+def mark_session_written(session, flush_context):
+    session.info['wrote'] = True
+    if has_request_context():
+        g.database_wrote = True
+
+def _recently_wrote():
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+@contextmanager
+def read_only_session():
+    """Run the block with db.session read-only.
+
+    A no-op while the session holds unflushed changes, or for a client inside
+    its read-your-writes window.
+    """
+    session = db.session()
+    if (session.info.get('read_only') or session.new or session.deleted or session.dirty
+            or (has_request_context() and _recently_wrote())):
+        yield session
+        return
+    saved = session.autoflush, session.expire_on_commit
+    session.autoflush = session.expire_on_commit = False
+    session.info['read_only'] = True
+    try:
+        yield session
+    finally:
+        session.autoflush, session.expire_on_commit = saved
+        session.info.pop('read_only', None)
+
+@contextmanager
+def primary_session():
+    """Run the block with db.session reading from the primary, even inside a read-only session."""
+    session = db.session()
+    saved = session.info.get('primary', False)
+    session.info['primary'] = True
+    try:
+        yield session
+    finally:
+        session.info['primary'] = saved
+
+def read_only(function):
+    """Decorate a controller that only reads, so it may be answered by a replica."""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with read_only_session():
+            return function(*args, **kwargs)
+    return wrapper
+
+def setup_read_routing(app):
+    """Open the read replicas, make GET and HEAD requests read-only, and start read-your-writes windows for clients that write."""
+    app.extensions['read_replicas'] = {
+        f'replica_{index}': create_engine(**options) for index, options in enumerate(replica_engine_options(app.config))
+    }
+
+    @app.before_request
+    def begin_read_only():
+        if request.method in ('GET', 'HEAD'):
+            g.read_only_session = read_only_session()
+            g.read_only_session.__enter__()
+
+    @app.after_request
+    def keep_reads_on_primary(response):
+        if g.get('database_wrote') and app.extensions['read_replicas']:
+            seconds = app.config['DATABASE_READ_YOUR_WRITES_SECONDS']
+            response.set_cookie(READ_YOUR_WRITES_COOKIE, str(int(time.time() + seconds) + 1), max_age=seconds + 1,
+                                httponly=True, samesite='Lax')
+        return response
+
+    @app.teardown_request
+    def end_read_only(exception=None):
+        session = g.pop('read_only_session', None)
+        if session is not None:
+            session.__exit__(None, None, None)
+
+def stored_value(target, name):
+    """An attribute of a mapped object as it was last stored, not as it was edited in memory.
+
+    For flush hooks that have to undo the old value; the attribute needs
+    active_history=True to be reliable for columns that are not yet loaded.
+    """
+    history = inspect(target).attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(target, name)
+
+def expire_stored_columns(session, model, columns, ids=None):
+    """Reload columns of the session's loaded model instances on next access.
+
+    For columns changed by core UPDATEs, which bypass the ORM. With ids, only
+    the instances with those primary keys are expired.
+    """
+    if ids is None:
+        instances = [instance for instance in session.identity_map.values() if isinstance(instance, model)]
+    else:
+        instances = [session.identity_map.get(session.identity_key(model, id)) for id in ids]
+    for instance in instances:
+        if instance is not None and not inspect(instance).deleted:
+            session.expire(instance, columns)
 
 def create_db():
     db.create_all()
     
 def init_db(app):
-    db.init_app(app)
\ No newline at end of file
+    db.init_app(app)
+
+
+class QueryBudgetExceeded(Exception):
+    """A view issued more SQL statements than its declared budget."""
+
+
+# Count every statement executed while handling a request
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_request_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def query_budget(limit):
+    """Declare the most SQL statements a view may issue, template rendering included.
+
+    Going over the budget raises QueryBudgetExceeded when QUERY_BUDGET_STRICT is
+    set (the default under TESTING) and logs a warning otherwise.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            start = g.get('query_count', 0)
+            response = view(*args, **kwargs)
+            used = g.get('query_count', 0) - start
+            if used > limit:
+                message = f"{view.__name__} issued {used} queries, over its budget of {limit}"
+                if current_app.config.get('QUERY_BUDGET_STRICT', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        return wrapper
+    return decorator
@@ -1,16 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token, set_access_cookies, unset_jwt_cookies
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, g
+from flask_jwt_extended import JWTManager, jwt_required, set_access_cookies, unset_jwt_cookies
 from App.models import Landlord, Tenant, Apartment, Review
-from App.database import db
+from App.database import db, pool_stats, query_budget, setup_engines, setup_read_routing
+from App.controllers.search import search_apartment_page, search_facets
+from App.controllers.search_cache import get_search_cache
+from App.controllers.auth import add_auth_context, create_identity_token, current_identity, current_user_record, refresh_identity_cookie, save_rehashed_password, setup_jwt
+from App.controllers.fragment_cache import cached_fragment
+from App.controllers.throttle import get_login_throttle, throttle_login
+from App.controllers.apartment import get_apartment_via_leasecode
+from App.controllers.landlord import get_landlord_stats
+from App.controllers.bulk_import import IMPORT_BATCH_SIZE, IMPORT_FORMATS, MAX_IMPORT_BATCH_SIZE, import_file
+from App.controllers.review import TIMESERIES_BUCKETS, get_rating_timeseries, get_review_page, has_reviewed as tenant_has_reviewed, insert_review, paginate_reviews, upsert_review
 from App.constants import AMENITIES, LOCATIONS
+from App.config import database_engine_options, load_database_config, load_login_throttle_config
+from App.passwords import DEFAULT_HASH_METHOD, HASH_CONFIG_FILENAME
+import io
+import math
 import os
 import secrets
 import string
+from datetime import date
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 
-def create_app():
+def create_app(overrides=None):
+    overrides = overrides or {}
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.root_path, 'data.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'super-secret-jwt-key')
@@ -20,9 +37,52 @@ def create_app():
     app.config['JWT_COOKIE_CSRF_PROTECT'] = False
     app.config['JWT_COOKIE_SECURE'] = False
     app.config['JWT_COOKIE_SAMESITE'] = 'Lax'
+    # Answer /search from the in-memory apartment index; False falls back to SQL
+    app.config['APARTMENT_INDEX_ENABLED'] = True
+    # Seconds before a worker rebuilds its index to pick up other workers' writes
+    app.config['APARTMENT_INDEX_MAX_AGE'] = 300
+    # Cache search result ids per worker; apartment writes invalidate it immediately
+    app.config['SEARCH_CACHE_ENABLED'] = True
+    app.config['SEARCH_CACHE_MAX_BYTES'] = 16 * 1024 * 1024
+    # Seconds a cached result may be served, bounding staleness from other workers' writes
+    app.config['SEARCH_CACHE_MAX_AGE'] = 60
+    # Serve the /api/... stats endpoints; they expose worker internals, so they are off by default
+    app.config['METRICS_ENDPOINTS_ENABLED'] = os.getenv('METRICS_ENDPOINTS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # Pseudo-reviews at the catalog mean added to every apartment's rating when ranking
+    app.config['RANKING_PRIOR_WEIGHT'] = 5
+    # Native threads per worker for password hashing (see App.passwords); 0 hashes inline
+    app.config['PASSWORD_HASH_POOL_SIZE'] = int(os.getenv('PASSWORD_HASH_POOL_SIZE', 2))
+    # Method for new password hashes; `flask auth calibrate` tunes it to this hardware
+    app.config['PASSWORD_HASH_METHOD'] = DEFAULT_HASH_METHOD
+    app.config.from_pyfile(os.path.join(app.instance_path, HASH_CONFIG_FILENAME), silent=True)
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', app.config['PASSWORD_HASH_METHOD'])
+    # Signed-in users cached per worker; the TTL bounds staleness from other workers' writes
+    app.config['IDENTITY_CACHE_ENABLED'] = True
+    app.config['IDENTITY_CACHE_MAX_ENTRIES'] = 1024
+    app.config['IDENTITY_CACHE_TTL'] = 300
+    # Rendered fragments per worker, keyed by the version of what they show
+    app.config['FRAGMENT_CACHE_ENABLED'] = True
+    app.config['FRAGMENT_CACHE_MAX_ENTRIES'] = 1024
+    load_login_throttle_config(app)
+    # Proxies in front of the app whose X-Forwarded-* headers are trusted, so that
+    # request.remote_addr (and the per-IP login throttle) sees the client; 1 on Render
+    app.config['PROXY_COUNT'] = int(os.getenv('PROXY_COUNT', 0))
+    # Database URI, pool and SQLite tuning (see App.config.DATABASE_DEFAULTS)
+    load_database_config(app)
+    for key in overrides:
+        app.config[key] = overrides[key]
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database_engine_options(app.config))
+    # Fail views that go over their query_budget() under test; only log in production
+    app.config.setdefault('QUERY_BUDGET_STRICT', app.config.get('TESTING', False))
+
+    if app.config['PROXY_COUNT']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'], x_proto=app.config['PROXY_COUNT'])
 
     db.init_app(app)
-    jwt = JWTManager(app)
+    setup_read_routing(app)
+    setup_engines(app)
+    jwt = setup_jwt(app)
+    add_auth_context(app)
 
     # Debug route to check all registered routes
     @app.route('/debug-routes')
@@ -45,6 +105,12 @@ def create_app():
                     flash('All fields are required', 'danger')
                     return redirect(url_for('login'))
 
+                # Turn away floods before they cost a password hash
+                retry_after = throttle_login(username, request.remote_addr)
+                if retry_after is not None:
+                    flash(f'Too many login attempts. Try again in {math.ceil(retry_after)} seconds.', 'danger')
+                    return render_template('login.html'), 429, {'Retry-After': str(math.ceil(retry_after))}
+
                 user = None
                 if role == 'landlord':
                     user = Landlord.query.filter_by(username=username).first()
@@ -57,12 +123,10 @@ def create_app():
                 if not user or not user.check_password(password):
                     flash('Invalid username or password', 'danger')
                     return redirect(url_for('login'))
+                save_rehashed_password(user)
 
-                access_token = create_access_token(identity={
-                    'id': user.id,
-                    'role': role,
-                    'username': user.username
-                })
+                has_reviewed = role == 'tenant' and tenant_has_reviewed(user.id, user.apartment_id)
+                access_token = create_identity_token(role, user, has_reviewed)
                 
                 resp = make_response(redirect(url_for('dashboard')))
                 set_access_cookies(resp, access_token)
@@ -105,7 +169,7 @@ def create_app():
                     return redirect(url_for('login'))
 
                 elif role == 'tenant':
-                    apartment = Apartment.query.filter_by(lease_code=lease_code).first()
+                    apartment = get_apartment_via_leasecode(lease_code)
                     if not apartment:
                         flash('Invalid lease code', 'danger')
                         return redirect(url_for('register'))
@@ -136,8 +200,9 @@ def create_app():
 
     @app.route('/register/check_lease', methods=['POST'])
     def check_lease_code():
+        # Forged or mistyped codes fail their signature check without touching the database
         lease_code = request.json.get('lease_code')
-        apartment = Apartment.query.filter_by(lease_code=lease_code).first()
+        apartment = get_apartment_via_leasecode(lease_code)
         
         if apartment:
             return jsonify({
@@ -159,48 +224,130 @@ def create_app():
 
     # Dashboard
     @app.route('/dashboard')
+    # Budgets include the signed-in user's lookup, which misses the identity cache at most once
+    @query_budget(4)
     @jwt_required()
     def dashboard():
-        current_user = get_jwt_identity()
+        current_user = current_identity()
         user_id = current_user.get('id')
         role = current_user.get('role')
 
         if role == 'landlord':
-            user = Landlord.query.get(user_id)
-            apartments = user.apartments_owned
-            return render_template('landlord_dashboard.html', apartments=apartments, user=user)
+            # The portfolio summary is one precomputed row, whatever the portfolio size
+            user = Landlord.query.options(joinedload(Landlord.stats)).filter_by(id=user_id).first()
+            apartments = Apartment.query.filter_by(landlord_id=user_id).order_by(Apartment.id).all()
+            tenant_counts = dict(
+                db.session.query(Tenant.apartment_id, func.count(Tenant.id))
+                .filter(Tenant.apartment_id.in_([apartment.id for apartment in apartments]))
+                .group_by(Tenant.apartment_id)
+            )
+            return render_template('landlord_dashboard.html', apartments=apartments, user=user, stats=user.stats, tenant_counts=tenant_counts)
         else:
-            user = Tenant.query.get(user_id)
-            apartment = Apartment.query.get(user.apartment_id)
-            has_reviewed = Review.query.filter_by(tenant_id=user.id, apartment_id=user.apartment_id).first() is not None
-            return render_template('tenant_dashboard.html', apartment=apartment, user=user, has_reviewed=has_reviewed)
+            user = current_user_record()
+            # Tokens issued before the claims existed fall back to a lookup
+            has_reviewed = current_user.get('has_reviewed')
+            if has_reviewed is None:
+                has_reviewed = tenant_has_reviewed(user_id, user.apartment_id)
+            apartment_id = current_user.get('apartment_id', user.apartment_id)
+
+            # One query for both the apartment's version and the tenant's own reviews
+            rows = (db.session.query(Apartment.version, Review)
+                    .select_from(Apartment)
+                    .outerjoin(Review, Review.tenant_id == user_id)
+                    .filter(Apartment.id == apartment_id)
+                    .order_by(Review.id)
+                    .all())
+            if not rows:
+                return render_template('tenant_dashboard.html', apartment_card=None, user=user, reviews=[], has_reviewed=has_reviewed)
+            apartment_card = cached_fragment(
+                ('tenant_apartment_card', apartment_id, rows[0][0]),
+                lambda: render_template('apartment_card.html', apartment=Apartment.query.get(apartment_id))
+            )
+            reviews = [review for _, review in rows if review is not None]
+            return render_template('tenant_dashboard.html', apartment_card=apartment_card, apartment_id=apartment_id,
+                                   user=user, reviews=reviews, has_reviewed=has_reviewed)
         
     # Apartment Routes
+    def page_args():
+        # Current query string minus the cursors, for building prev/next links
+        return {key: values for key, values in request.args.lists() if key not in ('after', 'before')}
+
+    def search_filters():
+        return {
+            'q': request.args.get('q', '').strip(),
+            'location': request.args.get('location'),
+            'amenities': request.args.getlist('amenities'),
+            'min_price': request.args.get('min_price', type=float),
+            'max_price': request.args.get('max_price', type=float),
+            # Only used to score results when sort=rank
+            'prefer': request.args.getlist('prefer'),
+            'target_price': request.args.get('target_price', type=float),
+            # Restrict to a radius around a location, nearest first
+            'near': request.args.get('near'),
+            'radius_km': request.args.get('radius_km', type=float)
+        }
+
+    def refine_url(**changes):
+        # Search URL with some parameters replaced; None removes a parameter
+        args = page_args()
+        for key, value in changes.items():
+            if value is None:
+                args.pop(key, None)
+            else:
+                args[key] = value
+        return url_for('search', **args)
+
     @app.route('/apartments')
     def apartments_list():
-        apartments = Apartment.query.all()
-        return render_template('apartments.html', apartments=apartments, locations=LOCATIONS, amenities=AMENITIES)
+        apartments, next_cursor, prev_cursor = search_apartment_page(
+            {},
+            sort=request.args.get('sort', 'newest'),
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=request.args.get('per_page', type=int)
+        )
+        return render_template('apartments.html',
+                            apartments=apartments,
+                            facets=search_facets({}),
+                            next_cursor=next_cursor,
+                            prev_cursor=prev_cursor,
+                            page_args=page_args(),
+                            locations=LOCATIONS,
+                            amenities=AMENITIES)
 
     @app.route('/apartments/<int:apartment_id>')
+    @query_budget(5)
     @jwt_required(optional=True)
     def apartment_detail(apartment_id):
-        apartment = Apartment.query.get_or_404(apartment_id)
-        reviews = Review.query.filter_by(apartment_id=apartment_id).all()
-        tenants = Tenant.query.filter_by(apartment_id=apartment_id).all()
-        
-        current_user = get_jwt_identity()
+        # One query each for the apartment with its landlord, the tenants, and a page of reviews with their authors
+        apartment = Apartment.query.options(
+            joinedload(Apartment.landlord),
+            selectinload(Apartment.tenants)
+        ).filter_by(id=apartment_id).first_or_404()
+        tenants = apartment.tenants
+        reviews, next_reviews, prev_reviews = paginate_reviews(
+            apartment_id,
+            sort=request.args.get('review_sort', 'newest'),
+            after=request.args.get('reviews_after'),
+            before=request.args.get('reviews_before')
+        )
+        
+        current_user = current_identity()
         has_reviewed = False
         can_review = False
         
         if current_user and current_user.get('role') == 'tenant':
-            tenant = Tenant.query.get(current_user.get('id'))
-            if tenant and tenant.apartment_id == apartment_id:
+            tenant_id = current_user.get('id')
+            if any(tenant.id == tenant_id for tenant in tenants):
                 can_review = True
-                has_reviewed = Review.query.filter_by(tenant_id=tenant.id, apartment_id=apartment_id).first() is not None
+                has_reviewed = any(review.tenant_id == tenant_id for review in reviews) or tenant_has_reviewed(tenant_id, apartment_id)
         
         return render_template('apartment_detail.html', 
                             apartment=apartment, 
                             reviews=reviews, 
+                            next_reviews=next_reviews,
+                            prev_reviews=prev_reviews,
+                            review_sort=request.args.get('review_sort', 'newest'),
                             tenants=tenants,
                             has_reviewed=has_reviewed,
                             can_review=can_review,
@@ -209,12 +356,12 @@ def create_app():
     @app.route('/apartments/create', methods=['GET', 'POST'])
     @jwt_required()
     def create_apartment():
-        current_user = get_jwt_identity()
+        current_user = current_identity()
         if current_user.get('role') != 'landlord':
             flash('Only landlords can create apartments', 'danger')
             return redirect(url_for('dashboard'))
 
-        landlord = Landlord.query.get(current_user.get('id'))
+        landlord = current_user_record()
         
         if request.method == 'POST':
             try:
@@ -223,6 +370,8 @@ def create_app():
                 location = request.form.get('location')
                 price = float(request.form.get('price'))
                 amenities = request.form.getlist('amenities')
+                latitude = request.form.get('latitude', type=float)
+                longitude = request.form.get('longitude', type=float)
                 
                 if not all([title, description, location, price, amenities]):
                     flash('All fields are required', 'danger')
@@ -234,7 +383,9 @@ def create_app():
                     location=location,
                     price=price,
                     landlord_id=landlord.id,
-                    amenities=amenities
+                    amenities=amenities,
+                    latitude=latitude,
+                    longitude=longitude
                 )
                 
                 db.session.add(apartment)
@@ -256,7 +407,7 @@ def create_app():
     @app.route('/apartments/<int:apartment_id>/edit', methods=['GET', 'POST'])
     @jwt_required()
     def edit_apartment(apartment_id):
-        current_user = get_jwt_identity()
+        current_user = current_identity()
         apartment = Apartment.query.get_or_404(apartment_id)
         
         if current_user.get('role') != 'landlord' or current_user.get('id') != apartment.landlord_id:
@@ -270,6 +421,8 @@ def create_app():
                 apartment.location = request.form.get('location')
                 apartment.price = float(request.form.get('price'))
                 apartment.amenities = request.form.getlist('amenities')
+                apartment.latitude = request.form.get('latitude', type=float)
+                apartment.longitude = request.form.get('longitude', type=float)
                 
                 apartment.validate()
                 db.session.commit()
@@ -293,7 +446,7 @@ def create_app():
     @app.route('/apartments/<int:apartment_id>/delete', methods=['POST'])
     @jwt_required()
     def delete_apartment(apartment_id):
-        current_user = get_jwt_identity()
+        current_user = current_identity()
         apartment = Apartment.query.get_or_404(apartment_id)
         
         if current_user.get('role') != 'landlord' or current_user.get('id') != apartment.landlord_id:
@@ -314,28 +467,18 @@ def create_app():
     @app.route('/apartments/<int:apartment_id>/reviews/add', methods=['GET', 'POST'])
     @jwt_required()
     def add_review(apartment_id):
-        current_user = get_jwt_identity()
+        current_user = current_identity()
         if current_user.get('role') != 'tenant':
             flash('Only tenants can add reviews', 'danger')
             return redirect(url_for('apartment_detail', apartment_id=apartment_id))
         
-        tenant = Tenant.query.get(current_user.get('id'))
+        tenant = current_user_record()
         apartment = Apartment.query.get_or_404(apartment_id)
         
         if not tenant or tenant.apartment_id != apartment_id:
             flash('You can only review your assigned apartment', 'danger')
             return redirect(url_for('apartment_detail', apartment_id=apartment_id))
         
-        # Check if already reviewed
-        existing_review = Review.query.filter_by(
-            tenant_id=tenant.id,
-            apartment_id=apartment_id
-        ).first()
-        
-        if existing_review:
-            flash('You have already reviewed this apartment', 'warning')
-            return redirect(url_for('apartment_detail', apartment_id=apartment_id))
-        
         if request.method == 'POST':
             try:
                 review = Review(
@@ -344,21 +487,28 @@ def create_app():
                     rating=int(request.form.get('rating')),
                     comment=request.form.get('comment')
                 )
-                db.session.add(review)
+                # The unique constraint rejects a second review, even from concurrent submits
+                if not insert_review(review):
+                    flash('You have already reviewed this apartment', 'warning')
+                    return refresh_identity_cookie(redirect(url_for('apartment_detail', apartment_id=apartment_id)), has_reviewed=True)
                 db.session.commit()
                 flash('Review added successfully!', 'success')
-                return redirect(url_for('apartment_detail', apartment_id=apartment_id))
+                return refresh_identity_cookie(redirect(url_for('apartment_detail', apartment_id=apartment_id)), has_reviewed=True)
             except Exception as e:
                 db.session.rollback()
                 flash(f'Error adding review: {str(e)}', 'danger')
                 return redirect(url_for('add_review', apartment_id=apartment_id))
         
+        if tenant_has_reviewed(tenant.id, apartment_id):
+            flash('You have already reviewed this apartment', 'warning')
+            return redirect(url_for('apartment_detail', apartment_id=apartment_id))
+        
         return render_template('add_review.html', apartment=apartment) 
     
     @app.route('/reviews/<int:review_id>/edit', methods=['GET', 'POST'])
     @jwt_required()
     def edit_review(review_id):
-        current_user = get_jwt_identity()
+        current_user = current_identity()
         review = Review.query.get_or_404(review_id)
         
         if current_user.get('role') != 'tenant' or current_user.get('id') != review.tenant_id:
@@ -392,7 +542,7 @@ def create_app():
     @app.route('/reviews/<int:review_id>/delete', methods=['POST'])
     @jwt_required()
     def delete_review(review_id):
-        current_user = get_jwt_identity()
+        current_user = current_identity()
         review = Review.query.get_or_404(review_id)
         
         if current_user.get('role') != 'tenant' or current_user.get('id') != review.tenant_id:
@@ -404,7 +554,10 @@ def create_app():
             db.session.delete(review)
             db.session.commit()
             flash('Review deleted successfully!', 'success')
-            return redirect(url_for('apartment_detail', apartment_id=apartment_id))
+            response = redirect(url_for('apartment_detail', apartment_id=apartment_id))
+            if apartment_id == current_user.get('apartment_id'):
+                refresh_identity_cookie(response, has_reviewed=False)
+            return response
         except Exception as e:
             db.session.rollback()
             flash(f'Error deleting review: {str(e)}', 'danger')
@@ -413,33 +566,133 @@ def create_app():
     # Search
     @app.route('/search', methods=['GET'])
     def search():
-        location = request.args.get('location')
-        amenities = request.args.getlist('amenities')
-        min_price = request.args.get('min_price', type=float)
-        max_price = request.args.get('max_price', type=float)
-        
-        query = Apartment.query
-        
-        if location and location in LOCATIONS:
-            query = query.filter_by(location=location)
-        
-        apartments = query.all()
-        
-        if amenities:
-            apartments = [apt for apt in apartments 
-                         if all(amenity in apt.amenities for amenity in amenities)]
-        
-        if min_price is not None:
-            apartments = [apt for apt in apartments if apt.price >= min_price]
-        
-        if max_price is not None:
-            apartments = [apt for apt in apartments if apt.price <= max_price]
-        
-        return render_template('search_results.html', 
+        filters = search_filters()
+        
+        apartments, next_cursor, prev_cursor = search_apartment_page(
+            filters,
+            sort=request.args.get('sort') or None,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=request.args.get('per_page', type=int),
+            # Send "X-Search-Cache: bypass" to always run the search
+            use_cache=request.headers.get('X-Search-Cache') != 'bypass'
+        )
+        
+        response = make_response(render_template('search_results.html', 
                             apartments=apartments, 
+                            facets=search_facets(filters),
+                            refine_url=refine_url,
+                            next_cursor=next_cursor,
+                            prev_cursor=prev_cursor,
+                            page_args=page_args(),
                             search_params=request.args,
                             locations=LOCATIONS,
-                            amenities=AMENITIES)
+                            amenities=AMENITIES))
+        response.headers['X-Search-Cache'] = g.search_cache_status
+        return response
+
+    @app.route('/api/search/facets', methods=['GET'])
+    def search_facets_api():
+        return jsonify(search_facets(search_filters()))
+
+    @app.route('/api/apartments/<int:apartment_id>/reviews', methods=['GET'])
+    def apartment_reviews_api(apartment_id):
+        if Apartment.query.get(apartment_id) is None:
+            return jsonify({'error': 'Apartment not found'}), 404
+        return jsonify(get_review_page(
+            apartment_id,
+            sort=request.args.get('sort', 'newest'),
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=request.args.get('per_page', type=int)
+        ))
+
+    @app.route('/api/apartments/<int:apartment_id>/ratings/timeseries', methods=['GET'])
+    def rating_timeseries_api(apartment_id):
+        if Apartment.query.get(apartment_id) is None:
+            return jsonify({'error': 'Apartment not found'}), 404
+        try:
+            start, end = (
+                date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                for name in ('from', 'to')
+            )
+        except ValueError:
+            return jsonify({'error': 'from and to must be dates (YYYY-MM-DD)'}), 400
+        bucket = request.args.get('bucket', 'week')
+        if bucket not in TIMESERIES_BUCKETS:
+            return jsonify({'error': 'bucket must be day, week or month'}), 400
+        return jsonify({
+            'apartment_id': apartment_id,
+            'bucket': bucket,
+            'series': get_rating_timeseries(apartment_id, start, end, bucket)
+        })
+
+    @app.route('/api/apartments/<int:apartment_id>/review', methods=['PUT'])
+    @jwt_required()
+    def upsert_review_api(apartment_id):
+        # Create or replace the signed-in tenant's review of their apartment
+        current_user = current_identity()
+        if current_user.get('role') != 'tenant':
+            return jsonify({'error': 'Only tenants can review apartments'}), 403
+        data = request.get_json(silent=True) or {}
+        # bool is an int subclass, so true and false would otherwise pass as ratings
+        if (not isinstance(data.get('rating'), int) or isinstance(data.get('rating'), bool)
+                or not isinstance(data.get('comment'), str)):
+            return jsonify({'error': 'rating (1-5) and comment are required'}), 400
+        review, created = upsert_review(current_user.get('id'), apartment_id, data['rating'], data['comment'])
+        if review is None:
+            return jsonify({'error': 'You can only review your assigned apartment, with a rating from 1 to 5'}), 400
+        response = refresh_identity_cookie(jsonify(review.get_json()), has_reviewed=True)
+        return response, 201 if created else 200
+
+    @app.route('/api/landlords/<int:landlord_id>/stats', methods=['GET'])
+    @jwt_required()
+    def landlord_stats_api(landlord_id):
+        # Occupancy and pricing are private to the landlord
+        current_user = current_identity()
+        if current_user.get('role') != 'landlord' or current_user.get('id') != landlord_id:
+            return jsonify({'error': 'You can only view your own stats'}), 403
+        stats = get_landlord_stats(landlord_id)
+        if stats is None:
+            return jsonify({'error': 'Landlord not found'}), 404
+        return jsonify(stats)
+
+    @app.route('/api/import', methods=['POST'])
+    @jwt_required()
+    def bulk_import_api():
+        # Stream a CSV or NDJSON body of the caller's apartments; accounts are only imported with `flask import`
+        current_user = current_identity()
+        if current_user.get('role') != 'landlord':
+            return jsonify({'error': 'Only landlords can import'}), 403
+        entity = request.args.get('entity', 'apartments')
+        if entity != 'apartments':
+            return jsonify({'error': 'Landlords can only import apartments'}), 403
+        format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+        batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
+        if format not in IMPORT_FORMATS or not 0 < batch_size <= MAX_IMPORT_BATCH_SIZE:
+            return jsonify({'error': f'format must be one of {IMPORT_FORMATS} and batch_size from 1 to {MAX_IMPORT_BATCH_SIZE}'}), 400
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        try:
+            report = import_file(entity, stream, format, batch_size, current_user.get('id'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(report)
+
+    # Worker internals for operators, only served when METRICS_ENDPOINTS_ENABLED is on
+    if app.config['METRICS_ENDPOINTS_ENABLED']:
+        @app.route('/api/login/throttle', methods=['GET'])
+        def login_throttle_stats():
+            throttle = get_login_throttle()
+            return jsonify(throttle.stats() if throttle is not None else {'enabled': False})
+
+        @app.route('/api/database/pool', methods=['GET'])
+        def database_pool_stats():
+            return jsonify(pool_stats())
+
+        @app.route('/api/search/cache', methods=['GET'])
+        def search_cache_stats():
+            cache = get_search_cache()
+            return jsonify(cache.stats() if cache is not None else {'enabled': False})
 
     return app
 
@@ -1,4 +1,6 @@
 from App.models.review import *
 from App.models.landlord import *
 from App.models.tenant import *
-from App.models.apartment import *
\ No newline at end of file
+from App.models.apartment import *
+from App.models.landlord_stats import *
+from App.models.rating_rollup import *
@@ -1,30 +1,61 @@
 from App.database import db
-from App.constants import AMENITIES, LOCATIONS
+from App.constants import AMENITIES, AMENITY_BITS, AMENITY_SET, LOCATIONS, LOCATION_COORDINATES, LOCATION_SET
+from flask import current_app
+from sqlalchemy import DDL, event, false
+from sqlalchemy.orm import object_session
 import hashlib
+import hmac
+
+# Crockford base32: no I, L, O or U, so codes survive being read aloud or retyped
+LEASE_CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+LEASE_CODE_MAC_LENGTH = 10
 
 class Apartment(db.Model):
+    __table_args__ = (
+        # Back location filters and (price, id) keyset pagination
+        db.Index('ix_apartment_location_price_id', 'location', 'price', 'id'),
+        db.Index('ix_apartment_price_id', 'price', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=False)
     location = db.Column(db.String(200), nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    # active_history loads the stored values before an edit so the landlord stats can move them
+    price = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
     
-    landlord_id = db.Column(db.Integer, db.ForeignKey('landlord.id'), nullable=False)  # Changed from 'user.id' to 'landlord.id'
+    # Indexed for the landlord dashboard (see `flask database advise`)
+    landlord_id = db.column_property(db.Column(db.Integer, db.ForeignKey('landlord.id'), nullable=False, index=True), active_history=True)  # Changed from 'user.id' to 'landlord.id'
     landlord = db.relationship('Landlord', back_populates='apartments_owned')  # Changed from 'User' to 'Landlord'
 
-    amenities = db.Column(db.PickleType, nullable=False, default=list)
+    # One bit per entry of AMENITIES; use the `amenities` property for the list form
+    amenity_mask = db.Column(db.BigInteger, nullable=False, default=0)
+
+    # Optional exact position; apartments without one are placed at their location's centre
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+
+    # Review aggregates, kept in step with the review table by App.models.review
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0)
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
+
+    # Bumped by every ORM update of the listing itself (not its review aggregates); keys cached fragments
+    version = db.Column(db.Integer, nullable=False, default=1)
 
-    lease_code = db.Column(db.String(32), unique=True, nullable=False)
     tenants = db.relationship('Tenant', back_populates='apartment')
     reviews = db.relationship('Review', back_populates='apartment', lazy=True, cascade="all, delete-orphan")
 
-    def __init__(self, title, description, location, price, landlord_id, amenities=None):
+    def __init__(self, title, description, location, price, landlord_id, amenities=None, latitude=None, longitude=None):
         self.title = title
         self.description = description
         self.location = self.validate_location(location)
         self.price = price
         self.landlord_id = landlord_id
-        self.lease_code = self.generate_lease_code(title, location, landlord_id)
     
         # Validate amenities before setting them
         if amenities is None:
@@ -32,8 +63,44 @@ class Apartment(db.Model):
         self.validate_amenities(amenities)
         self.amenities = amenities
 
+        self.validate_coordinates(latitude, longitude)
+        self.latitude = latitude
+        self.longitude = longitude
+
     def __repr__(self):
         return f"<Apartment {self.title} - {self.location}>"
+
+    @property
+    def amenities(self):
+        """List of amenity names decoded from the amenity bitmask."""
+        return self.mask_to_amenities(self.amenity_mask or 0)
+
+    @amenities.setter
+    def amenities(self, amenities):
+        self.validate_amenities(amenities)
+        self.amenity_mask = self.amenities_to_mask(amenities)
+
+    @property
+    def average_rating(self):
+        """Mean review rating, or None when there are no reviews."""
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def rating_histogram(self):
+        """Number of reviews for each rating, 1 to 5."""
+        return [self.rating_1 or 0, self.rating_2 or 0, self.rating_3 or 0, self.rating_4 or 0, self.rating_5 or 0]
+
+    @property
+    def lease_code(self):
+        """Signed lease verification code, derived from the id; None until the apartment is inserted."""
+        return self.generate_lease_code(self.id) if self.id is not None else None
+
+    @property
+    def coordinates(self):
+        """(latitude, longitude) of the apartment, falling back to its location's centre."""
+        return self.resolve_coordinates(self.location, self.latitude, self.longitude)
     
     def get_json(self):
         return {
@@ -45,31 +112,140 @@ class Apartment(db.Model):
             "landlord_id": self.landlord_id,
             "lease_code": self.lease_code,
             "reviews": [review.get_json() for review in self.reviews],
-            "amenities": self.amenities
+            "amenities": self.amenities,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "review_count": self.review_count,
+            "average_rating": self.average_rating,
+            "rating_histogram": self.rating_histogram
         }
 
     @staticmethod
-    def generate_lease_code(title, location, landlord_id):
-        """Generate a unique lease verification code."""
-        data = f"{title}{location}{landlord_id}".encode('utf-8')
-        return hashlib.md5(data).hexdigest()[:8]
+    def _lease_code_mac(apartment_id):
+        config = current_app.config
+        key = (config.get('LEASE_CODE_SECRET') or config['SECRET_KEY']).encode('utf-8')
+        digest = int.from_bytes(hmac.new(key, f'lease-code:{apartment_id}'.encode('utf-8'), hashlib.sha256).digest()[:8], 'big')
+        return ''.join(LEASE_CODE_ALPHABET[(digest >> (5 * i)) & 31] for i in range(LEASE_CODE_MAC_LENGTH))
+
+    @staticmethod
+    def generate_lease_code(apartment_id):
+        """Lease verification code for an apartment: its id in base32 and a truncated HMAC of it."""
+        encoded, number = '', apartment_id
+        while True:
+            number, digit = divmod(number, 32)
+            encoded = LEASE_CODE_ALPHABET[digit] + encoded
+            if not number:
+                break
+        return f"{encoded}-{Apartment._lease_code_mac(apartment_id)}"
+
+    @staticmethod
+    def lease_code_apartment_id(lease_code):
+        """The apartment id a lease code was signed for, or None if it is malformed or forged.
+
+        Needs no database access; the apartment itself may since have been deleted.
+        """
+        encoded, _, mac = (lease_code or '').strip().upper().partition('-')
+        if not encoded or len(mac) != LEASE_CODE_MAC_LENGTH or len(encoded) > 13:
+            return None
+        apartment_id = 0
+        for char in encoded:
+            digit = LEASE_CODE_ALPHABET.find(char)
+            if digit < 0:
+                return None
+            apartment_id = apartment_id * 32 + digit
+        if not hmac.compare_digest(mac, Apartment._lease_code_mac(apartment_id)):
+            return None
+        return apartment_id
+
+    @staticmethod
+    def amenities_to_mask(amenities):
+        """Encode a list of amenity names as a bitmask."""
+        mask = 0
+        for amenity in amenities:
+            mask |= AMENITY_BITS[amenity]
+        return mask
+
+    @staticmethod
+    def mask_to_amenities(mask):
+        """Decode a bitmask into amenity names, in AMENITIES order."""
+        return [amenity for amenity in AMENITIES if mask & AMENITY_BITS[amenity]]
+
+    @staticmethod
+    def resolve_coordinates(location, latitude, longitude):
+        """Exact coordinates when both are set, otherwise the centre of the location (or None)."""
+        if latitude is not None and longitude is not None:
+            return (latitude, longitude)
+        return LOCATION_COORDINATES.get(location)
+
+    @classmethod
+    def has_amenities(cls, amenities):
+        """SQL filter matching apartments that have every one of the given amenities."""
+        if any(amenity not in AMENITY_BITS for amenity in amenities):
+            return false()
+        required = cls.amenities_to_mask(amenities)
+        return cls.amenity_mask.op('&')(required) == required
 
     @staticmethod
     def validate_location(location):
         """Validate if the location is in the allowed locations list."""
-        if location not in LOCATIONS:
+        if location not in LOCATION_SET:
             raise ValueError(f"Invalid location: {location}. Must be one of {LOCATIONS}.")
         return location
     
     @staticmethod
     def validate_amenities(amenities):
         """Validate if all amenities are in the allowed amenities list."""
-        invalid_amenities = [amenity for amenity in amenities if amenity not in AMENITIES]
+        invalid_amenities = [amenity for amenity in amenities if amenity not in AMENITY_SET]
         if invalid_amenities:
             raise ValueError(f"Invalid amenities: {invalid_amenities}. Must be one of {AMENITIES}.")
 
+    @staticmethod
+    def validate_coordinates(latitude, longitude):
+        """Validate that coordinates are given together and lie on the globe."""
+        if (latitude is None) != (longitude is None):
+            raise ValueError("Latitude and longitude must be given together.")
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError(f"Invalid coordinates: ({latitude}, {longitude}).")
+
     def validate(self):
         """Run all validations before creating or updating an apartment."""
         self.validate_location(self.location)
         self.validate_amenities(self.amenities)
+        self.validate_coordinates(self.latitude, self.longitude)
+
+
+# Full-text search over title and description. SQLite keeps an external-content
+# FTS5 table in sync through triggers; Postgres uses a GIN expression index.
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE apartment_fts USING fts5(
+        title, description, content='apartment', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER apartment_fts_insert AFTER INSERT ON apartment BEGIN
+        INSERT INTO apartment_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER apartment_fts_delete AFTER DELETE ON apartment BEGIN
+        INSERT INTO apartment_fts(apartment_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER apartment_fts_update AFTER UPDATE OF title, description ON apartment BEGIN
+        INSERT INTO apartment_fts(apartment_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO apartment_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+POSTGRES_FTS_DDL = [
+    """CREATE INDEX ix_apartment_search ON apartment
+        USING gin (to_tsvector('english'::regconfig, title || ' ' || description))""",
+]
+
+for statement in SQLITE_FTS_DDL:
+    event.listen(Apartment.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_FTS_DDL:
+    event.listen(Apartment.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(Apartment.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS apartment_fts').execute_if(dialect='sqlite'))
+
 
+@event.listens_for(Apartment, 'before_update')
+def bump_apartment_version(mapper, connection, target):
+    # Incremented in SQL so concurrent writers never reuse a version
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = Apartment.version + 1
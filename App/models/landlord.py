@@ -1,4 +1,4 @@
-from werkzeug.security import check_password_hash, generate_password_hash
+from App.passwords import hash_password, needs_rehash, verify_password
 from App.database import db
 
 class Landlord(db.Model):
@@ -10,6 +10,9 @@ class Landlord(db.Model):
     # Relationship: A landlord owns multiple apartments
     apartments_owned = db.relationship('Apartment', back_populates='landlord', cascade="all, delete-orphan")
 
+    # Portfolio summary, maintained by App.models.landlord_stats
+    stats = db.relationship('LandlordStats', uselist=False, viewonly=True)
+
     def __init__(self, username, email, password):
         self.username = username
         self.email = email
@@ -19,10 +22,15 @@ class Landlord(db.Model):
         return f'Landlord {self.username} - {self.email}'
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # A hash made with an outdated method is replaced; the caller commits it
+        if not verify_password(self.password_hash, password):
+            return False
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
     def get_json(self):
         return {
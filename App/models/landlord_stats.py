@@ -0,0 +1,205 @@
+from App.database import db, expire_stored_columns, stored_value
+from App.models.landlord import Landlord
+from App.models.apartment import Apartment
+from App.models.tenant import Tenant
+from App.models.review import Review
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.orm import Session, object_session
+
+class LandlordStats(db.Model):
+    __tablename__ = 'landlord_stats'
+
+    landlord_id = db.Column(db.Integer, db.ForeignKey('landlord.id'), primary_key=True)
+    listing_count = db.Column(db.Integer, nullable=False, default=0)
+    # Apartments with at least one tenant
+    occupied_count = db.Column(db.Integer, nullable=False, default=0)
+    tenant_count = db.Column(db.Integer, nullable=False, default=0)
+    price_sum = db.Column(db.Float, nullable=False, default=0)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, landlord_id):
+        self.landlord_id = landlord_id
+
+    @property
+    def average_price(self):
+        """Mean monthly price of the landlord's listings, or None without any."""
+        return round(self.price_sum / self.listing_count, 2) if self.listing_count else None
+
+    @property
+    def average_rating(self):
+        """Mean rating over every review of the landlord's apartments, or None without any."""
+        return self.rating_sum / self.review_count if self.review_count else None
+
+    def get_json(self):
+        """Convert the LandlordStats object to JSON format."""
+        return {
+            "landlord_id": self.landlord_id,
+            "listing_count": self.listing_count,
+            "occupied_count": self.occupied_count,
+            "tenant_count": self.tenant_count,
+            "average_price": self.average_price,
+            "review_count": self.review_count,
+            "average_rating": self.average_rating,
+        }
+
+
+'''
+Incremental maintenance
+
+Like the apartment rating aggregates, every write that changes a landlord's
+portfolio adjusts its landlord_stats row with an UPDATE ... SET col = col + n
+in the same flush. Tenant and review writes reach the landlord through their
+apartment, so a move between apartments is a removal plus an addition.
+Occupancy only changes when an apartment's tenant count crosses zero, which
+is settled once per apartment after the flush. reconcile_landlord_stats()
+rebuilds the table from scratch to repair any drift.
+'''
+
+LANDLORD_STATS_COLUMNS = ['listing_count', 'occupied_count', 'tenant_count', 'price_sum', 'review_count', 'rating_sum']
+
+
+def _landlord_of(apartment_id):
+    apartment = Apartment.__table__
+    return select(apartment.c.landlord_id).where(apartment.c.id == apartment_id).scalar_subquery()
+
+
+def adjust_landlord_stats(connection, landlord_id, **deltas):
+    """Add deltas to columns of a landlord's stats row; landlord_id may be a scalar subquery."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    stats = LandlordStats.__table__
+    connection.execute(
+        update(stats)
+        .where(stats.c.landlord_id == landlord_id)
+        .values({stats.c[name]: stats.c[name] + delta for name, delta in deltas.items()})
+    )
+
+
+def _track_tenant_move(session, apartment_id, delta):
+    moves = session.info.setdefault('landlord_tenant_moves', {})
+    moves[apartment_id] = moves.get(apartment_id, 0) + delta
+
+
+@event.listens_for(Landlord, 'after_insert')
+def create_landlord_stats(mapper, connection, target):
+    connection.execute(insert(LandlordStats.__table__).values(landlord_id=target.id))
+
+
+@event.listens_for(Landlord, 'before_delete')
+def delete_landlord_stats(mapper, connection, target):
+    stats = LandlordStats.__table__
+    connection.execute(delete(stats).where(stats.c.landlord_id == target.id))
+
+
+@event.listens_for(Apartment, 'after_insert')
+def add_apartment_to_landlord_stats(mapper, connection, target):
+    adjust_landlord_stats(connection, target.landlord_id, listing_count=1, price_sum=target.price)
+    object_session(target).info['landlord_stats_changed'] = True
+
+
+@event.listens_for(Apartment, 'before_delete')
+def remove_apartment_from_landlord_stats(mapper, connection, target):
+    # Tenants and reviews are unlinked or deleted earlier in the flush and already subtracted
+    adjust_landlord_stats(
+        connection, stored_value(target, 'landlord_id'),
+        listing_count=-1, price_sum=-stored_value(target, 'price')
+    )
+    object_session(target).info['landlord_stats_changed'] = True
+
+
+@event.listens_for(Apartment, 'after_update')
+def move_apartment_in_landlord_stats(mapper, connection, target):
+    old_landlord_id = stored_value(target, 'landlord_id')
+    old_price = stored_value(target, 'price')
+    if old_landlord_id == target.landlord_id:
+        adjust_landlord_stats(connection, target.landlord_id, price_sum=target.price - old_price)
+    else:
+        # A transferred apartment takes its tenants and reviews along
+        apartment, tenant = Apartment.__table__, Tenant.__table__
+        tenants = connection.execute(
+            select(func.count()).select_from(tenant).where(tenant.c.apartment_id == target.id)
+        ).scalar()
+        review_count, rating_sum = connection.execute(
+            select(apartment.c.review_count, apartment.c.rating_sum).where(apartment.c.id == target.id)
+        ).one()
+        moved = dict(occupied_count=1 if tenants else 0, tenant_count=tenants,
+                     review_count=review_count, rating_sum=rating_sum)
+        adjust_landlord_stats(connection, old_landlord_id, listing_count=-1, price_sum=-old_price,
+                               **{name: -value for name, value in moved.items()})
+        adjust_landlord_stats(connection, target.landlord_id, listing_count=1, price_sum=target.price, **moved)
+    object_session(target).info['landlord_stats_changed'] = True
+
+
+@event.listens_for(Tenant, 'after_insert')
+def add_tenant_to_landlord_stats(mapper, connection, target):
+    adjust_landlord_stats(connection, _landlord_of(target.apartment_id), tenant_count=1)
+    _track_tenant_move(object_session(target), target.apartment_id, 1)
+
+
+@event.listens_for(Tenant, 'before_delete')
+def remove_tenant_from_landlord_stats(mapper, connection, target):
+    old_apartment_id = stored_value(target, 'apartment_id')
+    adjust_landlord_stats(connection, _landlord_of(old_apartment_id), tenant_count=-1)
+    _track_tenant_move(object_session(target), old_apartment_id, -1)
+
+
+@event.listens_for(Tenant, 'after_update')
+def move_tenant_in_landlord_stats(mapper, connection, target):
+    old_apartment_id = stored_value(target, 'apartment_id')
+    if old_apartment_id == target.apartment_id:
+        return
+    adjust_landlord_stats(connection, _landlord_of(old_apartment_id), tenant_count=-1)
+    adjust_landlord_stats(connection, _landlord_of(target.apartment_id), tenant_count=1)
+    _track_tenant_move(object_session(target), old_apartment_id, -1)
+    _track_tenant_move(object_session(target), target.apartment_id, 1)
+
+
+@event.listens_for(Review, 'after_insert')
+def add_review_to_landlord_stats(mapper, connection, target):
+    adjust_landlord_stats(connection, _landlord_of(target.apartment_id), review_count=1, rating_sum=target.rating)
+    object_session(target).info['landlord_stats_changed'] = True
+
+
+@event.listens_for(Review, 'before_delete')
+def remove_review_from_landlord_stats(mapper, connection, target):
+    adjust_landlord_stats(
+        connection, _landlord_of(stored_value(target, 'apartment_id')),
+        review_count=-1, rating_sum=-stored_value(target, 'rating')
+    )
+    object_session(target).info['landlord_stats_changed'] = True
+
+
+@event.listens_for(Review, 'after_update')
+def move_review_in_landlord_stats(mapper, connection, target):
+    old_apartment_id = stored_value(target, 'apartment_id')
+    old_rating = stored_value(target, 'rating')
+    if old_apartment_id == target.apartment_id and old_rating == target.rating:
+        return
+    adjust_landlord_stats(connection, _landlord_of(old_apartment_id), review_count=-1, rating_sum=-old_rating)
+    adjust_landlord_stats(connection, _landlord_of(target.apartment_id), review_count=1, rating_sum=target.rating)
+    object_session(target).info['landlord_stats_changed'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def settle_landlord_occupancy(session, flush_context):
+    moves = session.info.pop('landlord_tenant_moves', None)
+    if moves:
+        # An apartment became occupied or vacant if its tenant count crossed zero in this flush
+        tenant = Tenant.__table__
+        connection = session.connection()
+        for apartment_id, delta in moves.items():
+            if not delta:
+                continue
+            tenants = connection.execute(
+                select(func.count()).select_from(tenant).where(tenant.c.apartment_id == apartment_id)
+            ).scalar()
+            if tenants - delta == 0:
+                adjust_landlord_stats(connection, _landlord_of(apartment_id), occupied_count=1)
+            elif tenants == 0:
+                adjust_landlord_stats(connection, _landlord_of(apartment_id), occupied_count=-1)
+        session.info['landlord_stats_changed'] = True
+
+    if session.info.pop('landlord_stats_changed', False):
+        expire_stored_columns(session, LandlordStats, LANDLORD_STATS_COLUMNS)
@@ -0,0 +1,90 @@
+from App.database import db, stored_value
+from App.models.apartment import Apartment
+from App.models.review import Review
+from sqlalchemy import delete, event, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+class RatingRollup(db.Model):
+    """Reviews of one apartment created on one (UTC) day."""
+    __tablename__ = 'rating_rollup'
+
+    apartment_id = db.Column(db.Integer, db.ForeignKey('apartment.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, apartment_id, day, count=0, rating_sum=0):
+        self.apartment_id = apartment_id
+        self.day = day
+        self.count = count
+        self.rating_sum = rating_sum
+
+    def get_json(self):
+        """Convert the RatingRollup object to JSON format."""
+        return {
+            "apartment_id": self.apartment_id,
+            "day": self.day.isoformat(),
+            "count": self.count,
+            "rating_sum": self.rating_sum,
+        }
+
+
+'''
+Rollup maintenance
+
+Each review write adds its count and rating to the (apartment, day) row of
+the day it was created, in the same flush. A day's row is created by its
+first review and afterwards only adjusted, so charts read at most one row
+per day instead of scanning the review table. Both happen in one INSERT ...
+ON CONFLICT DO UPDATE, so concurrent first reviews of a day cannot collide.
+'''
+
+# Dialects with INSERT ... ON CONFLICT; others update, then insert if no row matched
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def add_to_rating_rollup(connection, apartment_id, day, count, rating_sum):
+    """Add count and rating_sum to an apartment's row for day, creating the row if needed."""
+    rollup = RatingRollup.__table__
+    dialect_insert = UPSERT_INSERTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(rollup).values(apartment_id=apartment_id, day=day, count=count, rating_sum=rating_sum)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[rollup.c.apartment_id, rollup.c.day],
+            set_={'count': rollup.c.count + statement.excluded.count,
+                  'rating_sum': rollup.c.rating_sum + statement.excluded.rating_sum}
+        ))
+        return
+    result = connection.execute(
+        update(rollup)
+        .where(rollup.c.apartment_id == apartment_id, rollup.c.day == day)
+        .values(count=rollup.c.count + count, rating_sum=rollup.c.rating_sum + rating_sum)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(rollup).values(apartment_id=apartment_id, day=day, count=count, rating_sum=rating_sum))
+
+
+@event.listens_for(Review, 'after_insert')
+def add_review_to_rollup(mapper, connection, target):
+    add_to_rating_rollup(connection, target.apartment_id, target.created_at.date(), 1, target.rating)
+
+
+@event.listens_for(Review, 'before_delete')
+def remove_review_from_rollup(mapper, connection, target):
+    add_to_rating_rollup(connection, stored_value(target, 'apartment_id'), target.created_at.date(), -1, -stored_value(target, 'rating'))
+
+
+@event.listens_for(Review, 'after_update')
+def move_review_in_rollup(mapper, connection, target):
+    old_apartment_id, old_rating = stored_value(target, 'apartment_id'), stored_value(target, 'rating')
+    if old_apartment_id == target.apartment_id and old_rating == target.rating:
+        return
+    day = target.created_at.date()
+    add_to_rating_rollup(connection, old_apartment_id, day, -1, -old_rating)
+    add_to_rating_rollup(connection, target.apartment_id, day, 1, target.rating)
+
+
+@event.listens_for(Apartment, 'before_delete')
+def delete_apartment_rollup(mapper, connection, target):
+    # Its reviews were deleted earlier in the flush, leaving only emptied rows
+    rollup = RatingRollup.__table__
+    connection.execute(delete(rollup).where(rollup.c.apartment_id == target.id))
@@ -1,15 +1,26 @@
 from datetime import datetime
-from App.database import db
+from App.database import db, expire_stored_columns, stored_value
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, object_session
 
 class Review(db.Model):
+    __table_args__ = (
+        # Back per-apartment review pages, newest first or by rating
+        db.Index('ix_review_apartment_created_id', 'apartment_id', 'created_at', 'id'),
+        db.Index('ix_review_apartment_rating_id', 'apartment_id', 'rating', 'id'),
+        # One review per tenant per apartment; also answers "has this tenant reviewed it?"
+        db.UniqueConstraint('tenant_id', 'apartment_id', name='uq_review_tenant_apartment'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     comment = db.Column(db.Text, nullable=False)
-    rating = db.Column(db.Integer, nullable=False)
+    # active_history loads the stored value before an edit so the aggregates can subtract it
+    rating = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
 
     tenant_id = db.Column(db.Integer, db.ForeignKey('tenant.id'), nullable=False)  # Reference to Tenant
     tenant = db.relationship('Tenant', back_populates='reviews')  # Define reverse relationship
 
-    apartment_id = db.Column(db.Integer, db.ForeignKey('apartment.id'), nullable=False)  # Reference to Apartment
+    apartment_id = db.column_property(db.Column(db.Integer, db.ForeignKey('apartment.id'), nullable=False), active_history=True)  # Reference to Apartment
     apartment = db.relationship('Apartment', back_populates='reviews')  # Define reverse relationship
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Automatically set the current time when a review is created
@@ -30,3 +41,67 @@ class Review(db.Model):
             "apartment_id": self.apartment_id,
             "created_at": self.created_at.isoformat()  # Convert to ISO format for easier handling
         }
+
+
+'''
+Rating aggregates
+
+Every review insert, update and delete adjusts its apartment's review_count,
+rating_sum and rating histogram with an UPDATE ... SET col = col + n issued
+during the same flush, so the aggregates commit or roll back together with
+the review itself, whichever code path wrote it.
+'''
+
+RATING_AGGREGATE_COLUMNS = ['review_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
+def _adjust_rating_aggregates(connection, apartment_id, rating, sign):
+    if rating not in range(1, 6):
+        raise ValueError(f"Invalid rating: {rating}. Must be between 1 and 5.")
+    apartment = db.metadata.tables['apartment']
+    histogram = apartment.c[f'rating_{rating}']
+    connection.execute(
+        update(apartment)
+        .where(apartment.c.id == apartment_id)
+        .values({
+            apartment.c.review_count: apartment.c.review_count + sign,
+            apartment.c.rating_sum: apartment.c.rating_sum + sign * rating,
+            histogram: histogram + sign,
+        })
+    )
+
+
+def _expire_rating_aggregates(session, apartment_id):
+    session.info.setdefault('rating_aggregates_changed', set()).add(apartment_id)
+
+
+@event.listens_for(Review, 'after_insert')
+def add_review_to_aggregates(mapper, connection, target):
+    _adjust_rating_aggregates(connection, target.apartment_id, target.rating, 1)
+    _expire_rating_aggregates(object_session(target), target.apartment_id)
+
+
+@event.listens_for(Review, 'before_delete')
+def remove_review_from_aggregates(mapper, connection, target):
+    old_apartment_id = stored_value(target, 'apartment_id')
+    _adjust_rating_aggregates(connection, old_apartment_id, stored_value(target, 'rating'), -1)
+    _expire_rating_aggregates(object_session(target), old_apartment_id)
+
+
+@event.listens_for(Review, 'after_update')
+def move_review_in_aggregates(mapper, connection, target):
+    old_apartment_id, old_rating = stored_value(target, 'apartment_id'), stored_value(target, 'rating')
+    if old_apartment_id == target.apartment_id and old_rating == target.rating:
+        return
+    _adjust_rating_aggregates(connection, old_apartment_id, old_rating, -1)
+    _adjust_rating_aggregates(connection, target.apartment_id, target.rating, 1)
+    _expire_rating_aggregates(object_session(target), old_apartment_id)
+    _expire_rating_aggregates(object_session(target), target.apartment_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def expire_rating_aggregates(session, flush_context):
+    from App.models.apartment import Apartment
+    changed = session.info.pop('rating_aggregates_changed', None)
+    if changed:
+        expire_stored_columns(session, Apartment, RATING_AGGREGATE_COLUMNS, changed)
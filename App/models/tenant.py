@@ -1,4 +1,4 @@
-from werkzeug.security import check_password_hash, generate_password_hash
+from App.passwords import hash_password, needs_rehash, verify_password
 from App.database import db
 from App.models.apartment import *
 
@@ -8,7 +8,8 @@ class Tenant(db.Model):
     email = db.Column(db.String(120), nullable=False, unique=True)
     password_hash = db.Column(db.String(255), nullable=False)
 
-    apartment_id = db.Column(db.Integer, db.ForeignKey('apartment.id'), nullable=False)  # Reference to Apartment
+    # Indexed for per-apartment tenant counts; active_history lets the landlord stats see moves
+    apartment_id = db.column_property(db.Column(db.Integer, db.ForeignKey('apartment.id'), nullable=False, index=True), active_history=True)  # Reference to Apartment
     apartment = db.relationship('Apartment', back_populates='tenants')  # Define reverse relationship
 
     reviews = db.relationship('Review', back_populates='tenant', lazy=True, cascade="all, delete-orphan")
@@ -18,19 +19,24 @@ class Tenant(db.Model):
         self.email = email
         self.set_password(password)
     
-        apartment = Apartment.query.filter_by(lease_code=lease_code).first()
-        if not apartment:
+        # Signed codes name their apartment; the primary-key lookup is free if the caller already loaded it
+        apartment_id = Apartment.lease_code_apartment_id(lease_code)
+        if apartment_id is None or Apartment.query.get(apartment_id) is None:
             raise ValueError("Invalid lease code: no apartment found.")
     
-        self.apartment_id = apartment.id
+        self.apartment_id = apartment_id
 
     def set_password(self, password):
         """Set the tenant's password securely (hashed)."""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        """Check the tenant's password."""
-        return check_password_hash(self.password_hash, password)
+        """Check the tenant's password, upgrading a hash made with an outdated method."""
+        if not verify_password(self.password_hash, password):
+            return False
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
     def get_json(self):
         """Convert the Tenant object to JSON format."""
@@ -0,0 +1,165 @@
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+try:
+    from gevent import monkey as gevent_monkey
+    from gevent.threadpool import ThreadPool as GeventThreadPool
+except ImportError:  # gevent only ships with the gunicorn worker
+    gevent_monkey = None
+
+'''
+Password hashing pool
+
+Hashing and verifying a password burns tens of milliseconds of CPU. Under
+gunicorn's gevent workers that would freeze every other request on the
+worker, so the work runs on a small pool of native threads (hashlib drops
+the GIL while it hashes) and the calling greenlet just waits for the result.
+PASSWORD_HASH_POOL_SIZE sets the number of threads per worker; 0 hashes inline.
+
+PASSWORD_HASH_METHOD is the werkzeug method new hashes use, as picked for this
+hardware by `flask auth calibrate`. Hashes made with any other method still
+verify, and are replaced on the user's next successful login.
+'''
+
+DEFAULT_POOL_SIZE = 2
+
+DEFAULT_HASH_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+# Written by `flask auth calibrate` into the instance folder and loaded by create_app()
+HASH_CONFIG_FILENAME = 'password_hash.cfg'
+
+_pool = None
+_pool_key = None
+
+
+def _pool_size():
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_POOL_SIZE', DEFAULT_POOL_SIZE)
+    return DEFAULT_POOL_SIZE
+
+
+def _gevent_patched():
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('threading')
+
+
+def _get_pool(size):
+    global _pool, _pool_key
+    # Forked workers must not share their parent's threads
+    key = (os.getpid(), size)
+    if _pool_key != key:
+        if _gevent_patched():
+            # Patched threading would only give us more greenlets; gevent's pool uses real threads
+            _pool = GeventThreadPool(size)
+        else:
+            _pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix='password-hash')
+        _pool_key = key
+    return _pool
+
+
+def run_hashing(function, *args):
+    """Run a CPU-bound hashing call on the pool and wait for its result."""
+    size = _pool_size()
+    if not size:
+        return function(*args)
+    pool = _get_pool(size)
+    if isinstance(pool, ThreadPoolExecutor):
+        return pool.submit(function, *args).result()
+    return pool.spawn(function, *args).get()
+
+
+def normalize_hash_method(method):
+    """Spell out werkzeug's implied digest and iteration count, as they appear in its hashes."""
+    parts = method.split(':')
+    if parts[0] != 'pbkdf2':
+        return method
+    digest = parts[1] if len(parts) > 1 else 'sha256'
+    iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+    return f'pbkdf2:{digest}:{iterations}'
+
+
+def _hash_method():
+    if has_app_context():
+        return normalize_hash_method(current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD))
+    return DEFAULT_HASH_METHOD
+
+
+def hash_password(password):
+    return run_hashing(generate_password_hash, password, _hash_method())
+
+
+def hash_passwords(passwords):
+    """Hash many passwords at once, spread over every thread in the pool."""
+    method = _hash_method()
+    size = _pool_size()
+    if not size:
+        return [generate_password_hash(password, method) for password in passwords]
+    return list(_get_pool(size).map(lambda password: generate_password_hash(password, method), passwords))
+
+
+def verify_password(password_hash, password):
+    return run_hashing(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Whether a stored hash was made with something other than the configured method."""
+    return password_hash.split('$', 1)[0] != _hash_method()
+
+
+'''
+Calibration
+'''
+
+# OWASP's minimum PBKDF2 iterations per digest; they are equally strong, so
+# candidates are compared by how far past their minimum the budget reaches
+RECOMMENDED_ITERATIONS = {'sha256': 600000, 'sha512': 210000}
+
+# Iterations are chosen in steps of this size
+ITERATION_STEP = 10000
+
+
+def _time_hash(method, samples):
+    password_hash = generate_password_hash('calibration', method)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        check_password_hash(password_hash, 'calibration')
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def calibrate_hash_method(target_ms, samples=5, probe_iterations=50000):
+    """Benchmark the PBKDF2 digests on this machine and pick iterations for target_ms per hash.
+
+    Returns (chosen, candidates), each candidate a dict of method, digest,
+    iterations, measured_ms and strength (iterations over the recommended
+    minimum). Timings run on the calling thread, one hash at a time, so run
+    this on an otherwise idle node of the same type as production.
+    """
+    candidates = []
+    for digest, recommended in RECOMMENDED_ITERATIONS.items():
+        probe_ms = _time_hash(f'pbkdf2:{digest}:{probe_iterations}', samples)
+        iterations = int(probe_iterations * target_ms / probe_ms) // ITERATION_STEP * ITERATION_STEP
+        iterations = max(iterations, ITERATION_STEP)
+        method = f'pbkdf2:{digest}:{iterations}'
+        candidates.append({
+            'method': method,
+            'digest': digest,
+            'iterations': iterations,
+            'measured_ms': round(_time_hash(method, samples), 1),
+            'strength': round(iterations / recommended, 2),
+        })
+    chosen = max(candidates, key=lambda candidate: candidate['strength'])
+    return chosen, candidates
+
+
+def write_hash_config(path, method):
+    """Save the chosen method where create_app() will pick it up."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as config_file:
+        config_file.write('# Written by `flask auth calibrate`; delete to fall back to the default\n')
+        config_file.write(f'PASSWORD_HASH_METHOD = {method!r}\n')
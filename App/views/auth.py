@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, current_user, unset_jwt_cookies, se
 
 from .index import index_views
 from App.controllers.auth import login
+from App.controllers.throttle import throttle_login
 from App.controllers.tenant import get_all_tenants  
 from App.controllers.landlord import get_all_landlords
 
@@ -51,6 +52,9 @@ API Routes
 @auth_views.route('/api/login', methods=['POST'])
 def user_login_api():
     data = request.json
+    retry_after = throttle_login(data['username'], request.remote_addr)
+    if retry_after is not None:
+        return jsonify(message='Too many login attempts'), 429, {'Retry-After': str(int(retry_after) + 1)}
     token = login(data['username'], data['password'])
     if not token:
         return jsonify(message='Bad username or password given'), 401
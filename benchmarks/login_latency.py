@@ -0,0 +1,97 @@
+"""Measure /login latency while other clients browse the site.
+
+Start the app under gunicorn's gevent worker with a single worker, so every
+request shares one event loop, once with inline hashing and once with the pool:
+
+    export FLASK_LOGIN_THROTTLE_ENABLED=false
+    PASSWORD_HASH_POOL_SIZE=0 gunicorn -c gunicorn_config.py -w 1 wsgi:app
+    PASSWORD_HASH_POOL_SIZE=2 gunicorn -c gunicorn_config.py -w 1 wsgi:app
+
+The login throttle must be off, or the repeated logins as one user are soon
+answered with 429s.
+and run this script against each (the defaults log in as the sample landlord):
+
+    python benchmarks/login_latency.py --url http://localhost:8080
+
+With inline hashing every login stalls the browsing requests queued behind it,
+which shows up in both the browse and login percentiles.
+"""
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def timed(opener, url, data=None):
+    started = time.perf_counter()
+    try:
+        opener.open(url, data=data, timeout=30).read()
+    except urllib.error.HTTPError as error:
+        if error.code == 429:
+            raise RuntimeError('Logins are being throttled; start the app with FLASK_LOGIN_THROTTLE_ENABLED=false') from error
+        # The login form answers with a redirect, which is what we expect
+        if error.code != 302:
+            raise
+    return time.perf_counter() - started
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+
+
+def report(name, samples):
+    if not samples:
+        print(f"{name:>7}: no requests completed")
+        return
+    print(f"{name:>7}: n={len(samples):5d}  p50={percentile(samples, 0.50):7.1f}ms  "
+          f"p95={percentile(samples, 0.95):7.1f}ms  p99={percentile(samples, 0.99):7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--username', default='bob')
+    parser.add_argument('--password', default='bobpass')
+    parser.add_argument('--role', default='landlord')
+    parser.add_argument('--browsers', type=int, default=8, help='concurrent clients loading /apartments')
+    parser.add_argument('--logins', type=int, default=2, help='concurrent clients logging in')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    args = parser.parse_args()
+
+    login_form = urllib.parse.urlencode({
+        'username': args.username, 'password': args.password, 'role': args.role
+    }).encode()
+    browse_times, login_times = [], []
+    deadline = time.monotonic() + args.duration
+
+    def browse():
+        opener = urllib.request.build_opener()
+        while time.monotonic() < deadline:
+            browse_times.append(timed(opener, args.url + '/apartments'))
+
+    def log_in():
+        opener = urllib.request.build_opener(NoRedirect)
+        while time.monotonic() < deadline:
+            login_times.append(timed(opener, args.url + '/login', login_form))
+
+    threads = [threading.Thread(target=browse) for _ in range(args.browsers)]
+    threads += [threading.Thread(target=log_in) for _ in range(args.logins)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report('browse', browse_times)
+    report('login', login_times)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 # gunicorn_config.py
 import multiprocessing
+import sys
 
 # The socket to bind.
 # "0.0.0.0" to bind to all interfaces. 8000 is the port number.
@@ -16,4 +17,12 @@ loglevel = 'info'
 
 # Where to log to
 accesslog = '-'  # '-' means log to stdout
-errorlog = '-'  # '-' means log to stderr
\ No newline at end of file
+errorlog = '-'  # '-' means log to stderr
+
+# With preload_app the app, and its connection pools, are created in the master
+# before forking; give each worker fresh connections instead of sharing sockets
+def post_fork(server, worker):
+    wsgi = sys.modules.get('wsgi')
+    if wsgi is not None:
+        from App.database import dispose_engines
+        dispose_engines(wsgi.app)
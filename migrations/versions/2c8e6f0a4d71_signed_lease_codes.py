@@ -0,0 +1,36 @@
+"""signed lease codes
+
+Revision ID: 2c8e6f0a4d71
+Revises: 7d1b3e9f5c20
+Create Date: 2026-10-18 19:58:41.270364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from App.models.apartment import Apartment
+
+
+# revision identifiers, used by Alembic.
+revision = '2c8e6f0a4d71'
+down_revision = '7d1b3e9f5c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Reissue every code in the signed format. Codes handed out before this
+    # revision stop working, and landlords must share the new ones.
+    apartment = sa.table('apartment', sa.column('id', sa.Integer), sa.column('lease_code', sa.String))
+    connection = op.get_bind()
+    for (apartment_id,) in connection.execute(sa.select(apartment.c.id)).fetchall():
+        connection.execute(
+            apartment.update()
+            .where(apartment.c.id == apartment_id)
+            .values(lease_code=Apartment.generate_lease_code(apartment_id))
+        )
+
+
+def downgrade():
+    # The signed codes are unique and fit the column, so they are kept
+    pass
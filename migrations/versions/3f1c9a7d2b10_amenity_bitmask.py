@@ -0,0 +1,58 @@
+"""store apartment amenities as a bitmask
+
+Revision ID: 3f1c9a7d2b10
+Revises:
+Create Date: 2026-10-18 09:12:44.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from App.constants import AMENITIES, AMENITY_BITS
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+apartment = sa.table(
+    'apartment',
+    sa.column('id', sa.Integer),
+    sa.column('amenities', sa.PickleType),
+    sa.column('amenity_mask', sa.BigInteger),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('amenity_mask', sa.BigInteger(), nullable=False, server_default='0'))
+
+    # Backfill the mask from the pickled lists; unknown names are dropped
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(apartment.c.id, apartment.c.amenities)).fetchall()
+    for apartment_id, amenities in rows:
+        mask = 0
+        for amenity in amenities or []:
+            mask |= AMENITY_BITS.get(amenity, 0)
+        conn.execute(apartment.update().where(apartment.c.id == apartment_id).values(amenity_mask=mask))
+
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.drop_column('amenities')
+
+
+def downgrade():
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('amenities', sa.PickleType(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(apartment.c.id, apartment.c.amenity_mask)).fetchall()
+    for apartment_id, mask in rows:
+        amenities = [amenity for amenity in AMENITIES if mask & AMENITY_BITS[amenity]]
+        conn.execute(apartment.update().where(apartment.c.id == apartment_id).values(amenities=amenities))
+
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.alter_column('amenities', existing_type=sa.PickleType(), nullable=False)
+        batch_op.drop_column('amenity_mask')
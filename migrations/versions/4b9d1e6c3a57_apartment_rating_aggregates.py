@@ -0,0 +1,43 @@
+"""denormalized review aggregates on apartment
+
+Revision ID: 4b9d1e6c3a57
+Revises: e7b3f05a9c21
+Create Date: 2026-10-18 15:21:37.092846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9d1e6c3a57'
+down_revision = 'e7b3f05a9c21'
+branch_labels = None
+depends_on = None
+
+
+AGGREGATE_COLUMNS = ['review_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
+def upgrade():
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        for name in AGGREGATE_COLUMNS:
+            batch_op.add_column(sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from the existing reviews
+    op.execute(
+        "UPDATE apartment SET "
+        "review_count = (SELECT count(*) FROM review WHERE review.apartment_id = apartment.id), "
+        "rating_sum = (SELECT coalesce(sum(rating), 0) FROM review WHERE review.apartment_id = apartment.id), "
+        + ", ".join(
+            f"rating_{rating} = (SELECT count(*) FROM review WHERE review.apartment_id = apartment.id AND rating = {rating})"
+            for rating in range(1, 6)
+        )
+    )
+
+
+def downgrade():
+    # Plain ALTER TABLE DROP COLUMN: a batch rebuild of apartment on SQLite
+    # would silently drop the full-text search triggers
+    for name in reversed(AGGREGATE_COLUMNS):
+        op.drop_column('apartment', name)
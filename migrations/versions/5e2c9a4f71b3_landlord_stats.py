@@ -0,0 +1,52 @@
+"""landlord portfolio stats
+
+Revision ID: 5e2c9a4f71b3
+Revises: d3a8b51f7e02
+Create Date: 2026-10-18 18:05:12.408317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2c9a4f71b3'
+down_revision = 'd3a8b51f7e02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('landlord_stats',
+    sa.Column('landlord_id', sa.Integer(), nullable=False),
+    sa.Column('listing_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('occupied_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('tenant_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('price_sum', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('review_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['landlord_id'], ['landlord.id'], ),
+    sa.PrimaryKeyConstraint('landlord_id')
+    )
+    op.create_index('ix_tenant_apartment_id', 'tenant', ['apartment_id'], unique=False)
+
+    # Backfill from the existing portfolios
+    op.execute(
+        "INSERT INTO landlord_stats "
+        "(landlord_id, listing_count, occupied_count, tenant_count, price_sum, review_count, rating_sum) "
+        "SELECT landlord.id, "
+        "(SELECT count(*) FROM apartment WHERE apartment.landlord_id = landlord.id), "
+        "(SELECT count(DISTINCT tenant.apartment_id) FROM tenant JOIN apartment ON apartment.id = tenant.apartment_id "
+        "WHERE apartment.landlord_id = landlord.id), "
+        "(SELECT count(*) FROM tenant JOIN apartment ON apartment.id = tenant.apartment_id "
+        "WHERE apartment.landlord_id = landlord.id), "
+        "(SELECT coalesce(sum(price), 0) FROM apartment WHERE apartment.landlord_id = landlord.id), "
+        "(SELECT coalesce(sum(review_count), 0) FROM apartment WHERE apartment.landlord_id = landlord.id), "
+        "(SELECT coalesce(sum(rating_sum), 0) FROM apartment WHERE apartment.landlord_id = landlord.id) "
+        "FROM landlord"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tenant_apartment_id', table_name='tenant')
+    op.drop_table('landlord_stats')
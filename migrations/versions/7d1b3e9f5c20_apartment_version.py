@@ -0,0 +1,27 @@
+"""apartment version counter
+
+Revision ID: 7d1b3e9f5c20
+Revises: a6f41d8c2e95
+Create Date: 2026-10-18 19:26:03.551840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d1b3e9f5c20'
+down_revision = 'a6f41d8c2e95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    # Plain ALTER TABLE DROP COLUMN: a batch rebuild of apartment on SQLite
+    # would silently drop the full-text search triggers
+    op.drop_column('apartment', 'version')
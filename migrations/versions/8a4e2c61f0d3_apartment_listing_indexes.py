@@ -0,0 +1,28 @@
+"""index apartment listings for keyset pagination
+
+Revision ID: 8a4e2c61f0d3
+Revises: 3f1c9a7d2b10
+Create Date: 2026-10-18 10:02:31.504117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e2c61f0d3'
+down_revision = '3f1c9a7d2b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.create_index('ix_apartment_location_price_id', ['location', 'price', 'id'], unique=False)
+        batch_op.create_index('ix_apartment_price_id', ['price', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.drop_index('ix_apartment_price_id')
+        batch_op.drop_index('ix_apartment_location_price_id')
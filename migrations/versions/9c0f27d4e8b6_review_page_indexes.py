@@ -0,0 +1,28 @@
+"""index reviews for per-apartment keyset pagination
+
+Revision ID: 9c0f27d4e8b6
+Revises: 4b9d1e6c3a57
+Create Date: 2026-10-18 16:40:12.318904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c0f27d4e8b6'
+down_revision = '4b9d1e6c3a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.create_index('ix_review_apartment_created_id', ['apartment_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_review_apartment_rating_id', ['apartment_id', 'rating', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.drop_index('ix_review_apartment_rating_id')
+        batch_op.drop_index('ix_review_apartment_created_id')
@@ -0,0 +1,37 @@
+"""daily rating rollups per apartment
+
+Revision ID: a6f41d8c2e95
+Revises: 5e2c9a4f71b3
+Create Date: 2026-10-18 18:47:30.116942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6f41d8c2e95'
+down_revision = '5e2c9a4f71b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rating_rollup',
+    sa.Column('apartment_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['apartment_id'], ['apartment.id'], ),
+    sa.PrimaryKeyConstraint('apartment_id', 'day')
+    )
+    # Large review tables can be rolled up afterwards with `flask review backfill-rollups`
+    op.execute(
+        "INSERT INTO rating_rollup (apartment_id, day, count, rating_sum) "
+        "SELECT apartment_id, date(created_at), count(*), sum(rating) FROM review "
+        "WHERE created_at IS NOT NULL GROUP BY apartment_id, date(created_at)"
+    )
+
+
+def downgrade():
+    op.drop_table('rating_rollup')
@@ -0,0 +1,53 @@
+"""derive lease codes from the apartment id
+
+Revision ID: b81f3d6a0c47
+Revises: 26679bb97338
+Create Date: 2026-10-18 20:41:12.604918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from App.models.apartment import Apartment, SQLITE_FTS_DDL
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f3d6a0c47'
+down_revision = '26679bb97338'
+branch_labels = None
+depends_on = None
+
+
+def _rebuild_apartment(alter):
+    # SQLite cannot drop or constrain a UNIQUE column in place, and the batch
+    # rebuild drops the full-text search triggers, so they are recreated
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        alter(batch_op)
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_DDL[1:]:
+            op.execute(statement)
+
+
+def upgrade():
+    # Codes are computed from the id, so handed-out codes keep working
+    if op.get_bind().dialect.name == 'sqlite':
+        _rebuild_apartment(lambda batch_op: batch_op.drop_column('lease_code'))
+    else:
+        op.drop_column('apartment', 'lease_code')
+
+
+def downgrade():
+    op.add_column('apartment', sa.Column('lease_code', sa.String(length=32), nullable=True))
+    apartment = sa.table('apartment', sa.column('id', sa.Integer), sa.column('lease_code', sa.String))
+    connection = op.get_bind()
+    for (apartment_id,) in connection.execute(sa.select(apartment.c.id)).fetchall():
+        connection.execute(
+            apartment.update()
+            .where(apartment.c.id == apartment_id)
+            .values(lease_code=Apartment.generate_lease_code(apartment_id))
+        )
+
+    def constrain(batch_op):
+        batch_op.alter_column('lease_code', existing_type=sa.String(length=32), nullable=False)
+        batch_op.create_unique_constraint('uq_apartment_lease_code', ['lease_code'])
+    _rebuild_apartment(constrain)
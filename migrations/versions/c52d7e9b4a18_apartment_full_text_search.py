@@ -0,0 +1,63 @@
+"""full-text search over apartment title and description
+
+Revision ID: c52d7e9b4a18
+Revises: 8a4e2c61f0d3
+Create Date: 2026-10-18 11:26:05.871342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d7e9b4a18'
+down_revision = '8a4e2c61f0d3'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    """CREATE VIRTUAL TABLE apartment_fts USING fts5(
+        title, description, content='apartment', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER apartment_fts_insert AFTER INSERT ON apartment BEGIN
+        INSERT INTO apartment_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER apartment_fts_delete AFTER DELETE ON apartment BEGIN
+        INSERT INTO apartment_fts(apartment_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER apartment_fts_update AFTER UPDATE OF title, description ON apartment BEGIN
+        INSERT INTO apartment_fts(apartment_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO apartment_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    # Index the rows that already exist
+    "INSERT INTO apartment_fts(apartment_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER apartment_fts_update",
+    "DROP TRIGGER apartment_fts_delete",
+    "DROP TRIGGER apartment_fts_insert",
+    "DROP TABLE apartment_fts",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute(
+            "CREATE INDEX ix_apartment_search ON apartment "
+            "USING gin (to_tsvector('english'::regconfig, title || ' ' || description))"
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX ix_apartment_search")
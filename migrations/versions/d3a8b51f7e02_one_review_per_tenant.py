@@ -0,0 +1,41 @@
+"""one review per tenant per apartment
+
+Revision ID: d3a8b51f7e02
+Revises: 9c0f27d4e8b6
+Create Date: 2026-10-18 17:32:48.775120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a8b51f7e02'
+down_revision = '9c0f27d4e8b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only each tenant's latest review of an apartment, then resync the aggregates
+    op.execute(
+        "DELETE FROM review WHERE id NOT IN "
+        "(SELECT max(id) FROM review GROUP BY tenant_id, apartment_id)"
+    )
+    op.execute(
+        "UPDATE apartment SET "
+        "review_count = (SELECT count(*) FROM review WHERE review.apartment_id = apartment.id), "
+        "rating_sum = (SELECT coalesce(sum(rating), 0) FROM review WHERE review.apartment_id = apartment.id), "
+        + ", ".join(
+            f"rating_{rating} = (SELECT count(*) FROM review WHERE review.apartment_id = apartment.id AND rating = {rating})"
+            for rating in range(1, 6)
+        )
+    )
+
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_review_tenant_apartment', ['tenant_id', 'apartment_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_review_tenant_apartment', type_='unique')
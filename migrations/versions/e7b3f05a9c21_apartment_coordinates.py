@@ -0,0 +1,29 @@
+"""optional apartment coordinates for proximity search
+
+Revision ID: e7b3f05a9c21
+Revises: c52d7e9b4a18
+Create Date: 2026-10-18 14:08:52.660413
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3f05a9c21'
+down_revision = 'c52d7e9b4a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('apartment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+
+def downgrade():
+    # Plain ALTER TABLE DROP COLUMN: a batch rebuild of apartment on SQLite
+    # would silently drop the full-text search triggers
+    op.drop_column('apartment', 'longitude')
+    op.drop_column('apartment', 'latitude')
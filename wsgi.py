@@ -1,11 +1,12 @@
-import click, pytest, sys
+import click, os, pytest, sys
 from flask import Flask
 from flask.cli import AppGroup
 
-from App.database import db, get_migrate
+from App.database import db, get_migrate, pool_stats
 from App.constants import AMENITIES, LOCATIONS
 from App.models import Landlord, Tenant, Apartment, Review
 from App.main import create_app
+from App.passwords import HASH_CONFIG_FILENAME, calibrate_hash_method, write_hash_config
 from App.controllers import (
     create_landlord, 
     create_tenant, 
@@ -16,12 +17,20 @@ from App.controllers import (
     create_apartment, 
     get_apartments, 
     create_review, 
-    get_reviews, 
+    get_review_page,
+    REVIEW_SORT_ORDERS,
     initialize,
     update_apartment,
     delete_apartment,
     search_apartments,
-    get_reviews_for_apartment
+    recompute_rating_aggregates,
+    backfill_rating_rollups,
+    reconcile_landlord_stats,
+    import_file,
+    IMPORT_ENTITIES,
+    advise_indexes,
+    recommended_indexes,
+    write_index_migration
 )
 
 # Create app and migrate
@@ -30,9 +39,13 @@ migrate = get_migrate(app)
 
 # This command creates and initializes the database
 @app.cli.command("init", help="Creates and initializes the database")
-def init():
+@click.option("--scale", type=int, default=None, help="Generate this many times the sample data instead")
+@click.option("--seed", type=int, default=0, help="Random seed for --scale")
+def init(scale, seed):
     try:
-        initialize()
+        written = initialize(scale, seed)
+        if written:
+            print(', '.join(f"{count} {table}" for table, count in written.items()))
         print('Database initialized')
     except Exception as e:
         print(f"Error initializing database: {e}")
@@ -77,6 +90,15 @@ def list_landlord_command(format):
     except Exception as e:
         print(f"Error fetching landlords: {e}")
 
+@landlord_cli.command("reconcile-stats", help="Rebuilds landlord portfolio stats from apartments, tenants and reviews")
+@click.option("--batch-size", type=int, default=500, help="Landlords per transaction")
+def reconcile_stats_command(batch_size):
+    try:
+        repaired = reconcile_landlord_stats(batch_size)
+        print(f"Portfolio stats corrected for {repaired} landlord(s).")
+    except Exception as e:
+        print(f"Error reconciling landlord stats: {e}")
+
 app.cli.add_command(landlord_cli)  # Add landlord commands group to the app
 
 '''
@@ -198,12 +220,17 @@ def delete_apartment_command(apartment_id):
     except Exception as e:
         print(f"Error deleting apartment: {e}")
 
-@apartment_cli.command("search", help="Search apartments by location and amenities")
+@apartment_cli.command("search", help="Search apartments by keywords, location, amenities and price")
+@click.option("--q", default=None, help="Keywords to match in the title or description")
 @click.option("--location", default=None)
 @click.option("--amenities", multiple=True)
-def search_apartment_command(location, amenities):
+@click.option("--min-price", type=float, default=None)
+@click.option("--max-price", type=float, default=None)
+@click.option("--near", default=None, help="Only apartments around this location, nearest first")
+@click.option("--radius-km", type=float, default=None)
+def search_apartment_command(q, location, amenities, min_price, max_price, near, radius_km):
     try:
-        filters = {}
+        filters = {'q': q, 'min_price': min_price, 'max_price': max_price, 'radius_km': radius_km}
 
         if location:
             if location not in LOCATIONS:
@@ -211,6 +238,12 @@ def search_apartment_command(location, amenities):
                 return
             filters['location'] = location
 
+        if near:
+            if near not in LOCATIONS:
+                print(f"Error: '{near}' is not a valid location. Choose from: {', '.join(LOCATIONS)}")
+                return
+            filters['near'] = near
+
         if amenities:
             invalid = [a for a in amenities if a not in AMENITIES]
             if invalid:
@@ -228,17 +261,21 @@ def search_apartment_command(location, amenities):
         print(f"Error searching apartments: {e}")
 
 
-@apartment_cli.command("reviews", help="List reviews for an apartment")
+def print_review_page(page):
+    if not page['reviews']:
+        print("No reviews found.")
+    for review in page['reviews']:
+        print(f"Rating: {review.get('rating')} | Comment: {review.get('comment')} ({review.get('tenant')})")
+    if page['next_cursor']:
+        print(f"More reviews: --after {page['next_cursor']}")
+
+@apartment_cli.command("reviews", help="List a page of reviews for an apartment")
 @click.argument("apartment_id", type=int)
-def apartment_reviews_command(apartment_id):
+@click.option("--sort", type=click.Choice(list(REVIEW_SORT_ORDERS)), default="newest")
+@click.option("--after", default=None, help="Cursor printed with the previous page")
+def apartment_reviews_command(apartment_id, sort, after):
     try:
-        reviews = get_reviews_for_apartment(apartment_id)  # Assuming this returns a list of dictionaries
-        if reviews:
-            for review in reviews:
-                # Print the review information using the correct keys
-                print(f"Rating: {review.get('rating')} | Comment: {review.get('comment')} (Tenant #{review.get('tenant_id')})")
-        else:
-            print("No reviews found.")
+        print_review_page(get_review_page(apartment_id, sort=sort, after=after))
     except Exception as e:
         print(f"Error retrieving reviews: {e}")
 
@@ -262,23 +299,118 @@ def create_review_command(tenant_id, apartment_id, rating, comment):
     except Exception as e:
         print(f"Error creating review: {e}")
 
-@review_cli.command("list", help="Lists reviews for an apartment")
+@review_cli.command("list", help="Lists a page of reviews for an apartment")
 @click.argument("apartment_id", default=1)
-def list_review_command(apartment_id):
+@click.option("--sort", type=click.Choice(list(REVIEW_SORT_ORDERS)), default="newest")
+@click.option("--after", default=None, help="Cursor printed with the previous page")
+def list_review_command(apartment_id, sort, after):
     try:
-        reviews = get_reviews(apartment_id)
-        if reviews:
-            for review in reviews:
-                print(f"Rating: {review.get('rating')}, Comment: {review.get('comment')}")
-                #print(f"Rating: {review.get('rating')}, Comment: {review.get('comment')}, Tenant: {review.get('tenant').get('username')}, Apartment: {review.get('apartment').get('title')}, Date: {review.get('created_at')}")
-
-        else:
-            print("No reviews found.")
+        print_review_page(get_review_page(apartment_id, sort=sort, after=after))
     except Exception as e:
         print(f"Error fetching reviews: {e}")
 
+@review_cli.command("recompute-aggregates", help="Recomputes apartment rating aggregates from their reviews")
+@click.option("--batch-size", type=int, default=500, help="Apartments per transaction")
+def recompute_aggregates_command(batch_size):
+    try:
+        repaired = recompute_rating_aggregates(batch_size)
+        print(f"Rating aggregates corrected for {repaired} apartment(s).")
+    except Exception as e:
+        print(f"Error recomputing rating aggregates: {e}")
+
+@review_cli.command("backfill-rollups", help="Rebuilds the daily rating rollups from existing reviews")
+@click.option("--chunk-size", type=int, default=5000, help="Reviews read per chunk; the rebuild commits once")
+def backfill_rollups_command(chunk_size):
+    try:
+        streamed = backfill_rating_rollups(chunk_size)
+        print(f"Rolled up {streamed} review(s).")
+    except Exception as e:
+        print(f"Error backfilling rating rollups: {e}")
+
 app.cli.add_command(review_cli)
 
+'''
+Database Commands
+'''
+
+database_cli = AppGroup('database', help='Database maintenance commands')
+
+@database_cli.command("advise", help="EXPLAINs the app's hot queries and writes a migration adding missing indexes")
+@click.option("--verbose", is_flag=True, help="Print every query plan")
+@click.option("--dry-run", is_flag=True, help="Report without writing a migration")
+def advise_command(verbose, dry_run):
+    advice = advise_indexes()
+    for item in advice:
+        if item.error:
+            status = f"error: {item.error}"
+        elif item.scans:
+            status = f"full scan of {', '.join(item.scans)}"
+        else:
+            status = "ok"
+        print(f"{item.shape.name:>36}: {status}")
+        if verbose or item.scans:
+            for step in item.plan:
+                print(f"{'':>38}{step}")
+    indexes = recommended_indexes(advice)
+    if not indexes:
+        print("No indexes to add.")
+        return
+    for name, table, columns in indexes:
+        print(f"Recommended: {name} ON {table} ({', '.join(columns)})")
+    if not dry_run:
+        print(f"Wrote {write_index_migration(indexes)}")
+
+@database_cli.command("pool", help="Shows the connection pool usage of this process")
+def pool_command():
+    for bind, stats in pool_stats().items():
+        print(f"{bind}: {stats['dialect']}, {stats['status']}")
+
+app.cli.add_command(database_cli)
+
+'''
+Import Commands
+'''
+
+@app.cli.command("import", help="Imports landlords, apartments or tenants from a CSV or NDJSON file")
+@click.argument("entity", type=click.Choice(IMPORT_ENTITIES))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", type=click.Choice(['csv', 'ndjson']), default=None, help="Defaults to the file extension")
+@click.option("--batch-size", type=int, default=500, help="Rows per transaction")
+def import_command(entity, path, format, batch_size):
+    format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, newline='', encoding='utf-8') as stream:
+        report = import_file(entity, stream, format, batch_size)
+    for error in report['errors']:
+        print(f"Line {error['line']}: {'; '.join(error['errors'])}")
+    if report['errors_truncated']:
+        print(f"... and {report['failed'] - len(report['errors'])} more failed row(s).")
+    print(f"Imported {report['imported']} {entity}, {report['failed']} row(s) failed.")
+
+'''
+Auth Commands
+'''
+
+auth_cli = AppGroup('auth', help='Authentication commands')
+
+@auth_cli.command("calibrate", help="Picks the password hash method for this hardware")
+@click.option("--target-ms", type=float, default=50, help="Time one hash should take")
+@click.option("--samples", type=int, default=5, help="Timings per candidate")
+@click.option("--dry-run", is_flag=True, help="Report the candidates without saving the choice")
+def calibrate_command(target_ms, samples, dry_run):
+    chosen, candidates = calibrate_hash_method(target_ms, samples)
+    for candidate in candidates:
+        print(f"{candidate['method']:>24}: {candidate['measured_ms']:6.1f}ms, "
+              f"{candidate['strength']:.2f}x the recommended iterations")
+    if chosen['strength'] < 1:
+        print(f"Warning: {target_ms}ms buys fewer iterations than recommended; consider a larger target.")
+    print(f"Chosen: {chosen['method']} (currently {app.config['PASSWORD_HASH_METHOD']})")
+    if not dry_run:
+        path = os.path.join(app.instance_path, HASH_CONFIG_FILENAME)
+        write_hash_config(path, chosen['method'])
+        print(f"Saved to {path}. Restart the app to use it; existing hashes upgrade as users sign in.")
+
+app.cli.add_command(auth_cli)
+
 '''
 Test Commands
 '''